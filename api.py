@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import urllib.parse
+
+import metrics
+from catalog import attach_catalog, load_catalog, watch_catalog
+from query import ALL_BRANDS, nearest_all_brands, nearest_brand, query_all_brands, query_brand, row_id_cache
+from units import widen_floats
+
+# Headless JSON API over the same filter engine as the Streamlit app, for ERP and
+# quoting tools. A small asyncio HTTP/1.1 server (standard library only) accepts
+# connections and hands each query to a shared thread pool; every request uses
+# the process-wide catalog from load_catalog(), so nothing is re-parsed per call;
+# a background watcher swaps in a new version when the workbook changes.
+# With --snapshot, workers attach to a catalog published by `python catalog.py`
+# instead of reading the workbook, and follow newly published versions.
+#
+#   GET  /health                 status, catalog version, unreadable workbook cells and query cache counters
+#   GET  /brands                 filterable attributes (with options) and dimensions per brand
+#   POST /query                  {"brand": "Excelta", "attributes": {"Cut": "Semi Flush"},
+#                                 "part_number": "9231", "dimensions": {"mm": 0.5, "awg": 24},
+#                                 "limit": 100}
+#                                or {"brand": "All Brands", "mm": 0.5, "inches": null, "awg": 24,
+#                                 "material": "Soft", "part_number": null}
+#                                when nothing matches, "nearest" holds the parts whose
+#                                ranges come closest, with their distances
+#   GET  /parts?q=170E[&brand=]  part-number hits, each with its cross-brand equivalents
+#   GET  /metrics                stage timings, event and cache counters as Prometheus
+#                                text (timings need CUTTER_METRICS, see metrics.py)
+
+DEFAULT_WORKBOOK = 'Cutter_Correlation_Chart5HF.xlsx'
+MAX_BODY_BYTES = 1 << 20
+
+# Content type of the routes that do not answer JSON
+CONTENT_TYPES = {'/metrics': 'text/plain; version=0.0.4; charset=utf-8'}
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _records(df, limit=None):
+    if limit is not None:
+        df = df.head(limit)
+    return widen_floats(df).to_json(orient='records')
+
+
+def _health(catalog, params, body):
+    return json.dumps({'status': 'ok', 'version': catalog.version, 'unreadable_cells': len(catalog.diagnostics),
+                       'row_id_cache': row_id_cache.stats()})
+
+
+def _brands(catalog, params, body):
+    return json.dumps({
+        name: {
+            'part_number_column': brand.schema.part_number_column,
+            'attributes': {column: index.options for column, index in brand.attributes.items()},
+            'dimensions': list(brand.ranges),
+        }
+        for name, brand in catalog.items()
+    })
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# JSON types of the /query fields, checked up front so a wrongly typed field is a
+# 400 rather than an error deep in the query: {field: (description, check)}
+QUERY_FIELDS = {
+    'brand': ('a string', lambda value: isinstance(value, str)),
+    'part_number': ('a string or null', lambda value: value is None or isinstance(value, str)),
+    'material': ('a string or null', lambda value: value is None or isinstance(value, str)),
+    'mm': ('a number or null', lambda value: value is None or _is_number(value)),
+    'inches': ('a number or null', lambda value: value is None or _is_number(value)),
+    'awg': ('a number or null', lambda value: value is None or _is_number(value)),
+    'limit': ('a non-negative integer or null',
+              lambda value: value is None or (isinstance(value, int) and not isinstance(value, bool) and value >= 0)),
+    'attributes': ('an object of strings or nulls', lambda value: value is None or (
+        isinstance(value, dict) and all(v is None or isinstance(v, str) for v in value.values()))),
+    'dimensions': ('an object of numbers or nulls', lambda value: value is None or (
+        isinstance(value, dict) and all(v is None or _is_number(v) for v in value.values()))),
+}
+
+
+def _query(catalog, params, body):
+    try:
+        spec = json.loads(body or b'{}')
+    except ValueError:
+        raise HttpError(400, 'request body must be JSON')
+    if not isinstance(spec, dict):
+        raise HttpError(400, 'request body must be a JSON object')
+    for field, (expected, check) in QUERY_FIELDS.items():
+        if field in spec and not check(spec[field]):
+            raise HttpError(400, f'{field} must be {expected}')
+    brand = spec.get('brand', ALL_BRANDS)
+    nearest = None
+    if brand == ALL_BRANDS:
+        wire = {'mm': spec.get('mm'), 'inches': spec.get('inches'), 'awg': spec.get('awg'),
+                'material': spec.get('material')}
+        results = query_all_brands(catalog, part_number=spec.get('part_number'), **wire)
+        if results.empty and not spec.get('part_number'):
+            nearest = nearest_all_brands(catalog, **wire)
+    else:
+        filters = {'attributes': spec.get('attributes'), 'part_number': spec.get('part_number'),
+                   'dimensions': spec.get('dimensions')}
+        results = query_brand(catalog, brand, **filters)
+        if results.empty:
+            nearest = nearest_brand(catalog, brand, **filters)
+    payload = f'{{"count": {len(results)}, "results": {_records(results, spec.get("limit"))}'
+    if nearest is not None and not nearest.empty:
+        payload += f', "nearest": {_records(nearest)}'
+    return payload + '}'
+
+
+def _parts(catalog, params, body):
+    query = params.get('q', [''])[0]
+    if not query:
+        raise HttpError(400, 'missing q parameter')
+    brand = params.get('brand', [None])[0]
+    if brand == ALL_BRANDS:
+        brand = None
+    if brand is not None and brand not in catalog:
+        raise HttpError(400, f'unknown brand {brand!r}; expected one of {list(catalog)}')
+    hits = catalog.parts.search(query, brand=brand)
+    entries = []
+    for hit in hits.itertuples(index=False):
+        equivalents = catalog.parts.equivalents(hit.Brand, hit.Row)
+        entries.append(f'{{"brand": {json.dumps(hit.Brand)}, "part_number": {json.dumps(str(hit.Part_Number))}, '
+                       f'"match": "{hit.Match}", "distance": {hit.Distance}, '
+                       f'"equivalents": {_records(equivalents)}}}')
+    return f'{{"count": {len(entries)}, "results": [{", ".join(entries)}]}}'
+
+
+def _metrics(catalog, params, body):
+    return metrics.prometheus_text()
+
+
+ROUTES = {
+    ('GET', '/health'): _health,
+    ('GET', '/brands'): _brands,
+    ('POST', '/query'): _query,
+    ('GET', '/parts'): _parts,
+    ('GET', '/metrics'): _metrics,
+}
+
+
+class QueryServer:
+    def __init__(self, workbook, workers=None, snapshot_dir=None):
+        self.workbook = workbook
+        self.snapshot_dir = snapshot_dir
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+
+    def catalog(self):
+        return attach_catalog(self.snapshot_dir) if self.snapshot_dir else load_catalog(self.workbook)
+
+    # Run one request against the shared catalog; returns (status, json text)
+    def handle(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        handler = ROUTES.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in ROUTES):
+                raise HttpError(405, f'{method} not allowed on {url.path}')
+            raise HttpError(404, f'no route for {url.path}')
+        metrics.begin_run(f'{method} {url.path}')
+        try:
+            with metrics.stage(f'api{url.path}'):
+                return 200, handler(self.catalog(), urllib.parse.parse_qs(url.query), body)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        finally:
+            metrics.end_run()
+
+    async def _respond(self, writer, status, payload, keep_alive, content_type='application/json'):
+        data = payload.encode()
+        writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                     f'Content-Type: {content_type}\r\n'
+                     f'Content-Length: {len(data)}\r\n'
+                     f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data)
+        await writer.drain()
+
+    # One client connection; serves requests until the client closes it
+    async def serve_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, json.dumps({'error': 'malformed request line'}), False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                length = headers.get('content-length') or '0'
+                if not (length.isascii() and length.isdigit()):
+                    error = json.dumps({'error': 'Content-Length must be a non-negative integer'})
+                    await self._respond(writer, 400, error, False)
+                    break
+                length = int(length)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, json.dumps({'error': 'request body too large'}), False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                content_type = CONTENT_TYPES.get(urllib.parse.urlsplit(target).path, 'application/json')
+                try:
+                    status, payload = await loop.run_in_executor(self.pool, self.handle, method, target, body)
+                except HttpError as e:
+                    status, payload, content_type = e.status, json.dumps({'error': str(e)}), 'application/json'
+                except Exception as e:  # keep serving other requests
+                    status, payload = 500, json.dumps({'error': f'{type(e).__name__}: {e}'})
+                    content_type = 'application/json'
+                await self._respond(writer, status, payload, keep_alive, content_type)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # Load and index every brand before accepting traffic (the catalog otherwise
+    # loads on first use), then keep it current
+    def warm(self):
+        (self.catalog() if self.snapshot_dir else watch_catalog(self.workbook)).warm()
+
+    async def serve(self, host, port):
+        await asyncio.get_running_loop().run_in_executor(self.pool, self.warm)
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve cutter catalog queries over HTTP/JSON')
+    parser.add_argument('--workbook', default=DEFAULT_WORKBOOK)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--snapshot', help='serve the catalog published in this snapshot directory instead')
+    parser.add_argument('--workers', type=int, default=None, help='query threads (default: Python\'s choice)')
+    args = parser.parse_args()
+    asyncio.run(QueryServer(args.workbook, args.workers, args.snapshot).serve(args.host, args.port))
@@ -0,0 +1,268 @@
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from catalog import load_catalog
+from crossbrand import fit_scores
+from schemas import MATERIALS
+from units import MM_PER_INCH, awg_to_mm, widen_floats
+
+# Bulk lookup for a bill of materials: one line per wanted part, given either as
+# a wire spec (mm / inches / AWG / material) or as a part number from any brand.
+# Wire specs are matched against every brand in one vectorized interval join per
+# brand (see RangePairIndex.join) instead of a filter pass per line; part numbers
+# are resolved once per distinct value. Results can be written as CSV or Excel in
+# chunks, so large outputs never need a second full copy in memory.
+#
+#   python batch.py bom.csv -o matches.xlsx [--top 5]
+
+DEFAULT_WORKBOOK = 'Cutter_Correlation_Chart5HF.xlsx'
+
+# Input column names (compared case-insensitively, ignoring spaces and punctuation)
+# -> the spec field they hold
+SPEC_COLUMNS = {
+    'partnumber': 'part_number', 'part': 'part_number', 'partno': 'part_number',
+    'mm': 'mm', 'millimeter': 'mm', 'millimeters': 'mm',
+    'inches': 'inches', 'inch': 'inches', 'in': 'inches',
+    'awg': 'awg', 'gauge': 'awg',
+    'material': 'material', 'wirematerial': 'material',
+}
+SPEC_FIELDS = ['part_number', 'mm', 'inches', 'awg', 'material']
+
+# Rows converted and written per step by the writers
+CHUNK_ROWS = 5000
+
+EXCEL_MAX_ROWS = 1048576
+
+
+def _spec_key(name):
+    return re.sub(r'[^a-z]', '', str(name).lower())
+
+
+# Read an uploaded or local BOM (.csv, .xlsx) with every cell as text. Legacy .xls
+# workbooks would need xlrd, so they are refused with a hint instead.
+def read_bom(source, file_name=None):
+    file_name = file_name or getattr(source, 'name', None) or str(source)
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.xls':
+        raise ValueError(f'{file_name}: .xls workbooks are not supported; save the BOM as .xlsx or .csv')
+    if extension == '.xlsx':
+        return pd.read_excel(source, dtype=str)
+    return pd.read_csv(source, dtype=str, skipinitialspace=True)
+
+
+# BOM lines -> one spec per line: part_number and material as text (None when not
+# given), mm / inches / awg as floats (NaN when not given or not a number)
+def parse_specs(bom):
+    fields = {}
+    for column in bom.columns:
+        field = SPEC_COLUMNS.get(_spec_key(column))
+        if field and field not in fields:
+            fields[field] = column
+    if not fields:
+        raise ValueError(f'no recognised columns in {list(bom.columns)}; expected some of '
+                         f'Part_Number, mm, inches, awg, material')
+
+    specs = pd.DataFrame(index=pd.RangeIndex(len(bom)))
+    for field in SPEC_FIELDS:
+        text = bom[fields[field]].str.strip() if field in fields else pd.Series(np.nan, index=specs.index)
+        text = text.where(text != '')
+        if field in ('part_number', 'material'):
+            specs[field] = text.astype(object).where(text.notna(), None)
+        else:
+            specs[field] = pd.to_numeric(text, errors='coerce').astype('float64')
+
+    material = specs['material'].map(lambda m: m if m is None else m.title())
+    unknown = material.notna() & ~material.isin(MATERIALS)
+    if unknown.any():
+        lines = (np.flatnonzero(unknown) + 1).tolist()
+        raise ValueError(f'unknown material on line(s) {lines[:10]}; expected one of {MATERIALS}')
+    specs['material'] = material
+    return specs
+
+
+def _contains(low, high, values):
+    return np.isnan(values) | ((low <= values) & (values <= high))
+
+
+# (lines, record ids, fit) of wire spec lines joined against every brand's
+# capacity records, best fit first within each line. Each line is driven through
+# one index (its mm diameter, else its inch diameter, else its AWG) and the pairs
+# found are then checked against the line's other values.
+def _wire_matches(brands, specs):
+    wire = specs['part_number'].isna().to_numpy()
+    mm = specs['mm'].to_numpy()
+    inches_mm = specs['inches'].to_numpy() * MM_PER_INCH
+    awg = specs['awg'].to_numpy()
+    material = specs['material'].to_numpy(dtype=object)
+    has_diameter = ~np.isnan(mm) | ~np.isnan(inches_mm)
+    diameter_driver = np.where(wire, np.where(np.isnan(mm), inches_mm, mm), np.nan)
+    awg_driver = np.where(wire & ~has_diameter, awg, np.nan)
+
+    records = brands.records
+    found_lines, found_ids = [], []
+    for offset, brand in zip(records.offsets, brands.values()):
+        capacity = brand.capacity
+        by_diameter = capacity.mm.join(diameter_driver)
+        by_awg = capacity.awg.join(awg_driver)
+        lines = np.concatenate([by_diameter[0], by_awg[0]])
+        rows = np.concatenate([by_diameter[1], by_awg[1]])
+
+        table = capacity.table
+        low = table['Capacity_Low_mm'].to_numpy()[rows]
+        high = table['Capacity_High_mm'].to_numpy()[rows]
+        keep = (_contains(low, high, mm[lines]) & _contains(low, high, inches_mm[lines])
+                & _contains(table['AWG_Low'].to_numpy()[rows], table['AWG_High'].to_numpy()[rows], awg[lines]))
+        wanted = pd.isna(material[lines])
+        if not wanted.all():
+            offered = table['Material'].to_numpy(dtype=object)[rows]
+            keep &= wanted | pd.isna(offered) | (material[lines] == offered)
+        lines, rows = lines[keep], rows[keep]
+
+        found_lines.append(lines)
+        found_ids.append(rows + offset)
+
+    lines, ids = np.concatenate(found_lines), np.concatenate(found_ids)
+    targets = [mm[lines], inches_mm[lines], awg_to_mm(awg[lines])]
+    fit = np.round(fit_scores(records.low_mm[ids], records.high_mm[ids], targets), 3)
+    order = np.lexsort((records.part_rank[ids], records.brand_of(ids), -fit, lines))
+    return lines[order], ids[order], fit[order]
+
+
+# [(line, match, record id, part number, similarity)] for part number lines: the
+# parts each number most likely means, then the closest parts of other brands
+# from the equivalence graph. Parts without a capacity record get id -1.
+def _part_matches(brands, specs):
+    first_record = {}
+    for offset, (name, brand) in zip(brands.records.offsets, brands.items()):
+        table_rows = brand.capacity.table['Row'].to_numpy()
+        for record in range(len(table_rows) - 1, -1, -1):
+            first_record[name, int(table_rows[record])] = offset + record
+
+    def entry(match, name, row, similarity):
+        part = brands[name].df[brands[name].schema.part_number_column].iat[row]
+        return match, first_record.get((name, row), -1), part, similarity
+
+    resolved = {}
+    for query in specs['part_number'].dropna().unique():
+        hits = brands.parts.best_matches(query)
+        entries = [entry(match, name, row, np.nan) for name, row, match, _ in hits]
+        if hits:
+            entries += [entry('equivalent', other, other_row, round(score, 3))
+                        for other, other_row, score in brands.equivalents.neighbours(*hits[0][:2])]
+        resolved[query] = entries
+
+    return [(line, *found) for line, query in specs['part_number'].dropna().items() for found in resolved[query]]
+
+
+# Match every BOM line. One result row per (line, matching part), best first
+# within each line, keeping at most `top` per line when given; lines that match
+# nothing get a single row with Match 'none'. The BOM's own columns are repeated
+# in front, prefixed with 'Input_'. Line is the 1-based line number in the BOM.
+#
+# Matches are found, sorted and trimmed as arrays of record ids; the records and
+# BOM columns are only copied out once, into the final frame.
+def match_bom(brands, bom, top=None):
+    specs = parse_specs(bom)
+    with metrics.stage('batch.wire_matches'):
+        wire_lines, wire_ids, wire_fit = _wire_matches(brands, specs)
+    with metrics.stage('batch.part_matches'):
+        parts = _part_matches(brands, specs)
+    part_lines, part_match, part_ids, part_numbers, part_similarity = (
+        [np.array(column) for column in zip(*parts)] if parts else [np.empty(0)] * 5)
+
+    lines = np.concatenate([wire_lines, part_lines]).astype(np.intp)
+    ids = np.concatenate([wire_ids, part_ids]).astype(np.intp)
+    match = np.concatenate([np.full(len(wire_lines), 'wire', dtype=object), part_match.astype(object)])
+    fit = np.concatenate([wire_fit, np.full(len(part_lines), np.nan)])
+    similarity = np.concatenate([np.full(len(wire_lines), np.nan), part_similarity.astype('float64')])
+    part_number = np.concatenate([np.full(len(wire_lines), None, dtype=object), part_numbers.astype(object)])
+
+    # A line is either a wire spec or a part number, so a stable sort on the line
+    # keeps each line's own ranking
+    keep = np.argsort(lines, kind='stable')
+    if top is not None:
+        starts = np.r_[0, np.flatnonzero(np.diff(lines[keep])) + 1]
+        rank = np.arange(len(keep)) - np.repeat(starts, np.diff(np.r_[starts, len(keep)]))
+        keep = keep[rank < top]
+    unmatched = np.setdiff1d(np.arange(len(bom)), lines)
+    lines = np.concatenate([lines[keep], unmatched])
+    order = np.argsort(lines, kind='stable')
+    lines = lines[order]
+
+    def pick(values, fill):
+        return np.concatenate([values[keep], np.full(len(unmatched), fill, dtype=values.dtype)])[order]
+
+    results = brands.records.table.reindex(pick(ids, -1)).reset_index(drop=True)
+    results['Part_Number'] = results['Part_Number'].astype(object)
+    overrides = pick(part_number, None)
+    has_override = pd.notna(overrides)
+    results.loc[has_override, 'Part_Number'] = overrides[has_override]
+    results.insert(0, 'Match', pick(match, 'none'))
+    results['Fit'] = pick(fit, np.nan)
+    results['Similarity'] = pick(similarity, np.nan)
+
+    inputs = bom.take(lines).reset_index(drop=True)
+    inputs.columns = [f'Input_{column}' for column in bom.columns]
+    return pd.concat([pd.DataFrame({'Line': lines + 1}), inputs, widen_floats(results)], axis=1)
+
+
+# One chunk of results for writing: open-ended ranges (an EREM AWG_High of inf)
+# become missing, so they are written blank as the app shows them
+def _output_chunk(results, start):
+    return results.iloc[start:start + CHUNK_ROWS].replace([np.inf, -np.inf], np.nan)
+
+
+def write_csv(results, out):
+    if results.empty:
+        results.to_csv(out, index=False)
+    for start in range(0, len(results), CHUNK_ROWS):
+        _output_chunk(results, start).to_csv(out, header=start == 0, index=False)
+
+
+# Write-only workbook: rows are appended chunk by chunk instead of building the
+# whole sheet in memory. openpyxl is imported here, on first use, so importing
+# this module (as the app does) does not pay for it.
+def write_excel(results, out):
+    import openpyxl
+
+    if len(results) >= EXCEL_MAX_ROWS:
+        raise ValueError(f'{len(results)} matches do not fit in one Excel sheet; write CSV or limit matches per line')
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Matches')
+    sheet.append(list(results.columns))
+    for start in range(0, len(results), CHUNK_ROWS):
+        chunk = _output_chunk(results, start).astype(object)
+        for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Match a BOM of wire specs / part numbers against the catalog')
+    parser.add_argument('bom', help='.csv or .xlsx with Part_Number and/or mm, inches, awg, material columns')
+    parser.add_argument('-o', '--out', help='.csv or .xlsx to write (default: CSV on stdout); CSV is much faster')
+    parser.add_argument('--workbook', default=DEFAULT_WORKBOOK)
+    parser.add_argument('--top', type=int, default=None, help='keep at most this many matches per line')
+    args = parser.parse_args()
+
+    if args.out and args.out.lower().endswith('.xls'):
+        parser.error(f'{args.out}: .xls is not supported; write .xlsx or .csv')
+    try:
+        results = match_bom(load_catalog(args.workbook), read_bom(args.bom), top=args.top)
+        if args.out is None:
+            write_csv(results, sys.stdout)
+        elif args.out.lower().endswith('.xlsx'):
+            write_excel(results, args.out)
+        else:
+            with open(args.out, 'w', newline='') as f:
+                write_csv(results, f)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.out:
+        print(f'{len(results)} rows for {len(set(results["Line"]))} lines -> {args.out}')
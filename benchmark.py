@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import catalog
+from catalog import BrandCatalog, Catalog
+from crossbrand import CapacityRecords
+from crossref import PartSearch
+from equivalents import GRAPH_FILE, build_graph, graph_key
+import query
+from query import brand_row_ids, query_all_brands, query_brand
+from schemas import BRANDS
+from units import AWG, INCHES, MM
+
+# Benchmarks of the hot paths on synthetic catalogs built from the real brand
+# schemas: workbook ingestion, per-brand normalization, index and catalog
+# construction, every filter type, cross-brand queries and the table render step
+# of the app. Needs no network or browser; results go out as JSON so two runs
+# (e.g. before and after a change) can be compared stage by stage.
+#
+#   python benchmark.py                          1k, 100k and 1M rows, JSON on stdout
+#   python benchmark.py --sizes 1000 --out a.json
+#
+# Rows are split evenly between the brands. The data is generated from --seed,
+# so runs with the same arguments time the same catalog.
+
+SIZES = [1_000, 100_000, 1_000_000]
+
+# Writing and reading a real .xlsx takes minutes at a million rows, so workbook
+# ingestion is only timed up to this many rows (see --max-workbook-rows)
+MAX_WORKBOOK_ROWS = 100_000
+
+# Rows of the page the app renders at a time (ptcsFINAL.DEFAULT_PAGE_SIZE)
+PAGE_ROWS = 100
+
+# Distinct values of a generated attribute column, and of the part numbers' series
+ATTRIBUTE_VALUES = 6
+SERIES = 50
+
+# Typical cutting capacities of each unit, as (smallest low, largest high), and
+# the widest capacity range generated, as a fraction of that span
+SPANS = {MM: (0.05, 2.0), INCHES: (0.002, 0.08), AWG: (10, 40)}
+MAX_WIDTH = 0.05
+
+
+# Raw cell text for one unit column, as the workbook would hold it
+def _unit_text(values, unit):
+    if unit == AWG:
+        return values.astype(int).astype(str) + 'AWG'
+    if unit == MM:
+        return np.char.add(np.char.mod('%.2f', values), 'mm')
+    return np.char.add(np.char.mod('%.3f', values), '"')
+
+
+# {sheet_name: raw DataFrame} with about `rows` rows in total, headed and typed as
+# the workbook's sheets are when read (text cells, spaces in the headers)
+def synthetic_sheets(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    per_brand = max(1, rows // len(BRANDS))
+    sheets = {}
+    for name, schema in BRANDS.items():
+        columns = {}
+        units = {unit.column: unit.unit for unit in schema.unit_columns}
+        number = rng.permutation(per_brand)
+        columns[schema.part_number_column] = np.char.add(
+            np.char.add(f'{name[:3].upper()}-', (number % SERIES).astype(str)), np.char.add('-', number.astype(str)))
+        for column in dict.fromkeys([a.column for a in schema.attributes] + [schema.cut_column]):
+            labels = list(schema.materials) if column == schema.material_column else [
+                f'{column.replace("_", " ")} {i}' for i in range(ATTRIBUTE_VALUES)]
+            columns[column] = np.array(labels)[rng.integers(len(labels), size=per_brand)]
+        for r in schema.ranges:
+            smallest, largest = SPANS[units[r.low]]
+            width = (largest - smallest) * rng.uniform(0, MAX_WIDTH, size=per_brand)
+            low = rng.uniform(smallest, largest - width)
+            columns[r.low] = _unit_text(low, units[r.low])
+            if r.high != r.low:
+                columns[r.high] = _unit_text(low + width, units[r.high])
+        for unit in schema.unit_columns:
+            if unit.column not in columns:
+                smallest, largest = SPANS[unit.unit]
+                columns[unit.column] = _unit_text(rng.uniform(smallest, largest * 50, size=per_brand), unit.unit)
+        columns['Link_to_Purchase'] = np.char.add('https://example.com/p/', number.astype(str))
+        sheets[name] = pd.DataFrame({column.replace('_', ' '): values for column, values in columns.items()})
+    return sheets
+
+
+def write_workbook(sheets, path):
+    book = openpyxl.Workbook(write_only=True)
+    for name, df in sheets.items():
+        sheet = book.create_sheet(name)
+        sheet.append(list(df.columns))
+        for row in df.itertuples(index=False):
+            sheet.append(list(row))
+    book.save(path)
+
+
+# Seconds per run of fn (min, median, mean over `repeat` runs). setup() runs
+# before each run, outside the timing, and its result is passed to fn.
+def measure(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        arguments = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        fn(*arguments)
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times), 'runs': repeat}
+
+
+# The styling ptcsFINAL.show_table applies, rendered to HTML as Streamlit would
+def render(df):
+    styled = df.style.set_properties(**{'text-align': 'left'}).set_table_styles(
+        [dict(selector='th', props=[('text-align', 'left')])])
+    return styled.format(precision=3, na_rep='').to_html()
+
+
+# A value inside most ranges of a range index: the median of the column midpoints
+def _probe(df, range_filter):
+    return range_filter.value_type(np.nanmedian((df[range_filter.low].astype('float64') +
+                                                 df[range_filter.high].astype('float64')) / 2))
+
+
+# Forget every cached filter and query result
+def cold():
+    query.row_id_cache.clear()
+    query.predicate_cache.clear()
+
+
+# Time one brand's filters, each answered cold (the query caches cleared first)
+def _filters(brands, name, repeat):
+    brand = brands[name]
+    schema = brand.schema
+    results = {}
+    for attribute in schema.attributes:
+        value = brand.attributes[attribute.column].options[0]
+        results[f'attribute/{attribute.column}'] = measure(
+            lambda _: query_brand(brands, name, attributes={attribute.column: value}), repeat, cold)
+    for r in schema.ranges:
+        value = _probe(brand.df, r)
+        results[f'range/{r.key}'] = measure(
+            lambda _: query_brand(brands, name, dimensions={r.key: value}), repeat, cold)
+    part = str(brand.df[schema.part_number_column].iloc[len(brand.df) // 2])
+    results['part_number/exact'] = measure(lambda _: query_brand(brands, name, part_number=part), repeat, cold)
+    results['part_number/prefix'] = measure(
+        lambda _: query_brand(brands, name, part_number=part[:6]), repeat, cold)
+    results['part_number/fuzzy'] = measure(
+        lambda _: query_brand(brands, name, part_number=part[:-1] + 'X'), repeat, cold)
+    # Every attribute at once, as row ids: intersecting the index's row id lists
+    # against the boolean masks over the columns that they replaced
+    every = {attribute.column: brand.attributes[attribute.column].options[0] for attribute in schema.attributes}
+    results['attributes/intersect'] = measure(lambda _: brand_row_ids(brands, name, attributes=every), repeat, cold)
+    results['attributes/mask'] = measure(
+        lambda: np.flatnonzero(np.logical_and.reduce([(brand.df[column] == value).to_numpy()
+                                                      for column, value in every.items()])), repeat)
+    combined = {'attributes': {schema.attributes[0].column: brand.attributes[schema.attributes[0].column].options[0]},
+                'dimensions': {schema.ranges[0].key: _probe(brand.df, schema.ranges[0])}}
+    results['combined'] = measure(lambda _: query_brand(brands, name, **combined), repeat, cold)
+    results['combined/cached'] = measure(lambda: query_brand(brands, name, **combined), repeat)
+    return results
+
+
+def _cross_brand(brands, repeat):
+    return {
+        'mm': measure(lambda: query_all_brands(brands, mm=0.5), repeat),
+        'inches': measure(lambda: query_all_brands(brands, inches=0.02), repeat),
+        'awg': measure(lambda: query_all_brands(brands, awg=24), repeat),
+        'mm+awg+material': measure(lambda: query_all_brands(brands, mm=0.5, awg=24, material='Soft'), repeat),
+        'part_number': measure(lambda: query_all_brands(brands, mm=0.5, part_number='EXC-7'), repeat),
+    }
+
+
+# Every stage for one catalog size: {stage: {...timings}}
+def run_size(rows, repeat, seed, workdir, max_workbook_rows):
+    sheets = synthetic_sheets(rows, seed)
+    result = {'rows': {name: len(df) for name, df in sheets.items()}}
+
+    if rows <= max_workbook_rows:
+        path = os.path.join(workdir, f'synthetic-{rows}-{seed}.xlsx')
+        if not os.path.exists(path):
+            write_workbook(sheets, path)
+        result['workbook_bytes'] = os.path.getsize(path)
+        result['ingest'] = measure(lambda: catalog._parse_workbook(path), max(1, repeat // 5))
+    else:
+        result['ingest'] = None
+
+    result['normalize'] = {name: measure(lambda df: catalog.process_sheet(df, name), repeat, df.copy)
+                           for name, df in sheets.items()}
+    frames = {name: catalog.process_sheet(df.copy(), name) for name, df in sheets.items()}
+    result['index'] = {name: measure(lambda: BrandCatalog(BRANDS[name], df), repeat)
+                       for name, df in frames.items()}
+    brands = {name: BrandCatalog(BRANDS[name], df) for name, df in frames.items()}
+    version = f'synthetic-{rows}-{seed}'
+
+    # The cross-brand structures Catalog builds, one by one
+    result['cross_brand_records'] = measure(lambda: CapacityRecords(brands), repeat)
+    result['equivalence_graph'] = measure(lambda: build_graph(brands), max(1, repeat // 5))
+    graph = build_graph(brands)
+    result['part_search'] = measure(lambda: PartSearch(brands, graph), repeat)
+
+    # Catalog reads the graph from graph_path when it was stored for this version
+    graph_path = os.path.join(workdir, f'{version}-{GRAPH_FILE}')
+    graph.save(graph_path, graph_key(version))
+    brands = Catalog(brands, version, graph_path).warm()
+
+    result['filter'] = {name: _filters(brands, name, repeat) for name in brands}
+    result['cross_brand'] = _cross_brand(brands, repeat)
+
+    brand_page = query_brand(brands, next(iter(brands))).head(PAGE_ROWS)
+    cross_brand_page = query_all_brands(brands, mm=0.5).head(PAGE_ROWS)
+    result['render'] = {
+        'page': measure(lambda: render(brand_page), repeat),
+        'cross_brand_page': measure(lambda: render(cross_brand_page), repeat),
+    }
+    return result
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    versions = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                'openpyxl': openpyxl.__version__}
+    try:
+        import pyarrow
+        versions['pyarrow'] = pyarrow.__version__
+    except ImportError:
+        pass
+    return {'commit': commit, 'platform': platform.platform(), 'cpus': os.cpu_count(), 'versions': versions}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the catalog hot paths on synthetic data; prints JSON')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='total rows per catalog')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement (ingestion and graph: a fifth)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-workbook-rows', type=int, default=MAX_WORKBOOK_ROWS,
+                        help='largest size whose .xlsx ingestion is timed')
+    parser.add_argument('--workdir', help='where generated workbooks are kept (default: a temporary directory)')
+    parser.add_argument('--out', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        report = {'environment': _environment(), 'repeat': args.repeat, 'seed': args.seed, 'sizes': {}}
+        for rows in args.sizes:
+            print(f'benchmarking {rows} rows...', file=sys.stderr)
+            report['sizes'][str(rows)] = run_size(rows, args.repeat, args.seed, args.workdir or scratch,
+                                                  args.max_workbook_rows)
+    text = json.dumps(report, indent=1)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,58 @@
+import collections
+import threading
+
+# Bounded least-recently-used cache shared by every session and thread in the
+# process. Entries belong to one catalog version: the first lookup for a new
+# version drops everything cached for the old one, so results never outlive the
+# workbook snapshot they were computed from.
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    # The cached value for key, or compute() stored under it. compute runs outside
+    # the lock, so two threads missing the same key may both compute it.
+    def get_or_compute(self, version, key, compute):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            # Don't store a result for a version replaced while computing it
+            if version == self._version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,493 @@
+import argparse
+import collections.abc
+import concurrent.futures
+import functools
+import hashlib
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+
+import pandas as pd
+
+import metrics
+import snapshot
+import units
+import workbook
+from crossbrand import CapacityRecords, CapacityTable
+from crossref import PartSearch
+from equivalents import GRAPH_FILE, build_graph, graph_key, load_or_build_graph
+from indexes import CategoryIndex, RangePairIndex
+from schemas import BRANDS, categorical_columns
+
+# Brand sheets in the workbook, in the order they are offered in the sidebar
+SHEET_NAMES = list(BRANDS)
+
+# Process-wide state shared by every Streamlit session (and any other importer).
+# Streamlit re-executes the app script on each rerun but keeps imported modules,
+# so anything kept here is parsed once per process rather than once per rerun.
+_lock = threading.Lock()
+_digests = {}  # abs path -> (mtime_ns, size, sha256)
+_loaded = {}   # abs path -> (fingerprint, Catalog)
+_attached = {}  # abs snapshot dir -> (manifest identity, Catalog)
+_watchers = {}  # abs path -> WorkbookWatcher
+
+# Seconds between checks of a watched workbook
+WATCH_INTERVAL = 5.0
+
+# Columns of the report of cells the loader could not read (Row is the
+# spreadsheet row number, Value the cell as written)
+DIAGNOSTIC_COLUMNS = ['Row', 'Column', 'Value', 'Problem']
+
+# Workbooks at least this large have their sheets parsed in parallel processes;
+# for smaller ones starting the processes costs more than it saves
+PARALLEL_MIN_BYTES = 1 << 20
+
+
+# An index rebuilt from its arrays in `stored` (named '<prefix>/<array>') when a
+# snapshot provided them, otherwise built from the frame
+def _stored_or_built(index_type, stored, prefix, build):
+    arrays = {name[len(prefix) + 1:]: array for name, array in stored.items() if name.startswith(prefix + '/')}
+    return index_type.from_arrays(arrays) if arrays else build()
+
+
+# One normalized brand sheet together with the indexes built over it. stored
+# holds index arrays read from a snapshot (see index_arrays), so a process
+# attaching to a published snapshot maps the indexes instead of sorting again.
+# key identifies the sheet contents and schema (see _sheet_keys), and
+# diagnostics lists the cells that could not be read (DIAGNOSTIC_COLUMNS).
+class BrandCatalog:
+    def __init__(self, schema, df, stored=None, key=None, diagnostics=None):
+        stored = stored or {}
+        self.schema = schema
+        self.df = df
+        self.key = key
+        self.diagnostics = diagnostics if diagnostics is not None else pd.DataFrame(columns=DIAGNOSTIC_COLUMNS)
+        with metrics.stage('catalog.index'):
+            self.ranges = {r.key: _stored_or_built(RangePairIndex, stored, f'range/{r.key}',
+                                                   lambda r=r: RangePairIndex(df[r.low], df[r.high]))
+                           for r in schema.ranges}
+            self.attributes = {a.column: _stored_or_built(CategoryIndex, stored, f'attribute/{a.column}',
+                                                          lambda a=a: CategoryIndex(df[a.column]))
+                               for a in schema.attributes}
+            self.part_numbers = _stored_or_built(CategoryIndex, stored, 'part_number',
+                                                 lambda: CategoryIndex(df[schema.part_number_column]))
+            self.capacity = CapacityTable(schema, df)
+
+    # {name: ndarray} of every index, for storing next to the frame in a snapshot
+    def index_arrays(self):
+        arrays = {}
+        named = ([(f'range/{key}', index) for key, index in self.ranges.items()]
+                 + [(f'attribute/{column}', index) for column, index in self.attributes.items()]
+                 + [('part_number', self.part_numbers)])
+        for prefix, index in named:
+            arrays.update({f'{prefix}/{name}': array for name, array in index.to_arrays().items()})
+        return arrays
+
+
+# {sheet_name: BrandCatalog} for one workbook version, plus the structures that
+# span brands. version identifies the workbook contents and the schema that
+# normalized them. The equivalence graph is read from (or stored to) graph_path
+# when given, and built in memory otherwise.
+#
+# Everything is loaded on first use: a brand may be given as a zero-argument
+# loader instead of a BrandCatalog, which runs the first time the brand is looked
+# up, and the cross-brand structures are built the first time they are read. A
+# session that only views one brand never opens the others. warm() loads it all.
+class Catalog(collections.abc.Mapping):
+    def __init__(self, brands, version, graph_path=None):
+        self._brands = dict(brands)
+        self._lock = threading.Lock()
+        self.version = version
+        self.graph_path = graph_path
+
+    def __getitem__(self, name):
+        brand = self._brands[name]
+        if isinstance(brand, BrandCatalog):
+            return brand
+        with self._lock:
+            if not isinstance(self._brands[name], BrandCatalog):
+                self._brands[name] = self._brands[name]()
+            return self._brands[name]
+
+    def __iter__(self):
+        return iter(self._brands)
+
+    def __len__(self):
+        return len(self._brands)
+
+    # Without loading the brand (Mapping's default looks it up)
+    def __contains__(self, name):
+        return name in self._brands
+
+    # {sheet_name: BrandCatalog} of the brands loaded so far
+    def loaded(self):
+        return {name: brand for name, brand in self._brands.items() if isinstance(brand, BrandCatalog)}
+
+    @functools.cached_property
+    def records(self):
+        return CapacityRecords(self)
+
+    @functools.cached_property
+    def equivalents(self):
+        with metrics.stage('catalog.equivalents'):
+            if self.graph_path:
+                return load_or_build_graph(self, self.graph_path, self.version)
+            return build_graph(self)
+
+    @functools.cached_property
+    def parts(self):
+        with metrics.stage('catalog.part_search'):
+            return PartSearch(self, self.equivalents)
+
+    @functools.cached_property
+    def diagnostics(self):
+        return pd.concat([brand.diagnostics.assign(Brand=name) for name, brand in self.items()],
+                         ignore_index=True)[['Brand'] + DIAGNOSTIC_COLUMNS]
+
+    # Load every brand and build every cross-brand structure now, e.g. before a
+    # new version is swapped in or a server starts taking traffic
+    def warm(self):
+        for name in self:
+            self[name]
+        for structure in ('records', 'parts', 'diagnostics'):
+            getattr(self, structure)
+        return self
+
+
+# Hash the workbook contents, only re-reading the file when its mtime or size moved
+def file_fingerprint(file_path):
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    memo = _digests.get(path)
+    if memo is None or memo[:2] != (stat.st_mtime_ns, stat.st_size):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        memo = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        _digests[path] = memo
+    return (path,) + memo
+
+
+# Normalize a raw sheet according to its brand schema: one vectorized pass per
+# dimension column that reads every cell's number and unit at once (see
+# units.parse_column) and converts to the declared dtype
+def process_sheet(df, sheet_name):
+    schema = BRANDS[sheet_name]
+    with metrics.stage('catalog.normalize'):
+        return _as_categories(_normalize_values(df, schema), schema)
+
+
+# Which end of a range cell ('22-26 AWG') a column keeps: the low or high
+# column of a range filter, or neither when it is not one (or is both)
+def _range_bound(schema, column):
+    low = any(r.low == column for r in schema.ranges)
+    high = any(r.high == column for r in schema.ranges)
+    return 'low' if low and not high else 'high' if high and not low else None
+
+
+# Normalize values in place. Cells that cannot be read are left missing and,
+# when diagnostics is a list, reported in it as DIAGNOSTIC_COLUMNS frames.
+def _normalize_values(df, schema, diagnostics=None):
+    # Strip leading/trailing whitespaces from column names and normalize
+    df.columns = df.columns.str.strip().str.replace('\n', ' ').str.replace('\r', '').str.replace(' ', '_')
+
+    for column in schema.title_case_columns:
+        # A column can be all blank (float NaN) in a chunk of a streamed sheet
+        if column in df.columns and not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = df[column].str.strip().str.title()
+
+    for unit in schema.unit_columns:
+        if unit.column not in df.columns:
+            continue
+        integer = unit.dtype.lower().startswith('int')
+        values, problems = units.parse_column(df[unit.column], unit.unit, _range_bound(schema, unit.column),
+                                              whole=integer)
+        if diagnostics is not None and len(problems):
+            diagnostics.append(pd.DataFrame({'Row': problems.index + 2, 'Column': unit.column,
+                                             'Value': df.loc[problems.index, unit.column].astype(str).to_numpy(),
+                                             'Problem': problems.to_numpy()}))
+        dtype = unit.dtype.capitalize() if integer and pd.isna(values).any() else unit.dtype
+        df[unit.column] = pd.Series(values, index=df.index).astype(dtype)
+    return df
+
+
+def _as_categories(df, schema):
+    for column in categorical_columns(schema):
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+# Stream one sheet of an open workbook (see workbook.iter_sheet_chunks) and
+# normalize it chunk by chunk: besides the compact normalized columns, only one
+# chunk of raw cell values is held at a time, however large the sheet. Categories
+# are assigned once over the joined columns. Returns (frame, diagnostics).
+def _read_sheet(book, sheet_name):
+    schema = BRANDS[sheet_name]
+    chunks, diagnostics = [], []
+    with metrics.stage('catalog.read_sheet'):
+        for chunk in workbook.iter_sheet_chunks(book, sheet_name):
+            with metrics.stage('catalog.normalize'):
+                chunks.append(_normalize_values(chunk, schema, diagnostics))
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True).infer_objects()
+    report = pd.concat(diagnostics, ignore_index=True) if diagnostics else pd.DataFrame(columns=DIAGNOSTIC_COLUMNS)
+    return _as_categories(df, schema), report.sort_values(['Row', 'Column'], ignore_index=True)
+
+
+# (frame, diagnostics) of one sheet, opening the workbook for it
+def _ingest_sheet(file_path, sheet_name):
+    book = workbook.open_workbook(file_path)
+    try:
+        return _read_sheet(book, sheet_name)
+    finally:
+        book.close()
+
+
+# {sheet_name: (frame, diagnostics)} for the given brand sheets (all by default).
+# openpyxl parsing is CPU-bound and holds the GIL, so a large workbook is read one
+# sheet per process, each worker opening the workbook for its own sheet and
+# normalizing it; otherwise the workbook is opened once and the sheets are
+# streamed in turn. Processes are spawned rather than forked because the app and
+# API server have threads running.
+def _parse_workbook(path, sheet_names=SHEET_NAMES):
+    sheet_names = list(sheet_names)
+    workers = min(len(sheet_names), os.cpu_count() or 1)
+    if workers > 1 and os.path.getsize(path) >= PARALLEL_MIN_BYTES:
+        try:
+            context = multiprocessing.get_context('spawn')
+            with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+                return dict(zip(sheet_names, pool.map(_ingest_sheet, [path] * len(sheet_names), sheet_names)))
+        except (OSError, concurrent.futures.process.BrokenProcessPool):
+            pass  # no processes available here; parse in this one
+    if not sheet_names:
+        return {}
+    book = workbook.open_workbook(path)
+    try:
+        return {name: _read_sheet(book, name) for name in sheet_names}
+    finally:
+        book.close()
+
+
+# {sheet_name: key} where a sheet's key covers its cell values (see
+# workbook.sheet_fingerprints) and the schema that normalizes it, so editing one
+# tab, or one brand's schema, only invalidates that brand. When the sheets
+# cannot be fingerprinted, every key falls back to the whole-file hash.
+def _sheet_keys(path, workbook_hash):
+    try:
+        fingerprints = workbook.sheet_fingerprints(path, SHEET_NAMES)
+    except ValueError:
+        fingerprints = dict.fromkeys(SHEET_NAMES, workbook_hash)
+    return {name: hashlib.sha256(f'{fingerprints[name]}\n{BRANDS[name]!r}'.encode()).hexdigest()
+            for name in SHEET_NAMES}
+
+
+# Catalog version (and snapshot key): the keys of all its sheets
+def _catalog_version(sheet_keys):
+    return hashlib.sha256('\n'.join(sheet_keys[name] for name in SHEET_NAMES).encode()).hexdigest()
+
+
+# Write an indexed catalog as the current snapshot version: frames, index arrays
+# and the equivalence graph all land in the version folder before the manifest
+# swap makes it current
+def _write_snapshot(snapshot_dir, catalog):
+    def add_graph(folder):
+        catalog.equivalents.save(os.path.join(folder, GRAPH_FILE), graph_key(catalog.version))
+
+    return snapshot.write_snapshot(snapshot_dir, catalog.version,
+                                   {name: brand.df for name, brand in catalog.items()},
+                                   {name: brand.index_arrays() for name, brand in catalog.items()},
+                                   before_publish=add_graph,
+                                   sheet_keys={name: brand.key for name, brand in catalog.items()},
+                                   diagnostics={name: brand.diagnostics.to_dict('records')
+                                                for name, brand in catalog.items()})
+
+
+# Diagnostics frame of a sheet from its snapshot manifest entry
+def _diagnostics(entry):
+    return pd.DataFrame(entry.get('diagnostics', []), columns=DIAGNOSTIC_COLUMNS)
+
+
+def _open_brand(snapshot_dir, name, entry):
+    with metrics.stage('catalog.open_sheet'):
+        df, indexes = snapshot.open_sheet(snapshot_dir, entry)
+        return BrandCatalog(BRANDS[name], df, indexes, entry.get('key'), _diagnostics(entry))
+
+
+# Catalog of the snapshot version that is current in snapshot_dir (only if it
+# was built from source_key, when given), or None. Each brand's sheet is opened
+# when the brand is first looked up (see Catalog).
+def _open_snapshot_catalog(snapshot_dir, source_key=None):
+    manifest = snapshot.read_manifest(snapshot_dir)
+    if manifest is None or source_key is not None and manifest['source_key'] != source_key:
+        return None
+    entries = manifest['sheets']
+    if not all(name in entries and os.path.isdir(os.path.join(snapshot_dir, entries[name]['folder']))
+               for name in SHEET_NAMES):
+        return None
+    brands = {name: functools.partial(_open_brand, snapshot_dir, name, entries[name]) for name in SHEET_NAMES}
+    graph_path = os.path.join(snapshot.version_dir(snapshot_dir, manifest['source_key']), GRAPH_FILE)
+    return Catalog(brands, manifest['source_key'], graph_path)
+
+
+# Catalog of the workbook sheets with these keys, re-ingesting only what changed.
+# Each sheet comes from, in order: the previous catalog in memory (same key: its
+# frame and indexes are reused as they are), the copy stored in the snapshot, or
+# the workbook, parsed and indexed. The cross-brand structures are rebuilt.
+def _build(path, sheet_keys, snapshot_dir, previous=None):
+    brands = {name: brand for name, brand in (previous.loaded() if previous else {}).items()
+              if brand.key == sheet_keys[name]}
+    sheets, indexes, entries = snapshot.open_sheets(snapshot_dir, {name: key for name, key in sheet_keys.items()
+                                                                   if name not in brands})
+    for name, df in sheets.items():
+        brands[name] = BrandCatalog(BRANDS[name], df, indexes[name], sheet_keys[name], _diagnostics(entries[name]))
+    parsed = _parse_workbook(path, [name for name in SHEET_NAMES if name not in brands])
+    for name, (df, diagnostics) in parsed.items():
+        brands[name] = BrandCatalog(BRANDS[name], df, None, sheet_keys[name], diagnostics)
+    return Catalog({name: brands[name] for name in SHEET_NAMES}, _catalog_version(sheet_keys))
+
+
+# Ingest the workbook and publish it as the current snapshot version (by default
+# <workbook>.snapshot). Processes serving from the snapshot pick the new version
+# up on their next attach_catalog() call.
+def build_snapshot(file_path, snapshot_dir=None):
+    fingerprint = file_fingerprint(file_path)
+    snapshot_dir = snapshot_dir or snapshot.snapshot_dir_for(file_path)
+    catalog = _build(fingerprint[0], _sheet_keys(fingerprint[0], fingerprint[3]), snapshot_dir)
+    return _write_snapshot(snapshot_dir, catalog)
+
+
+# Load from the snapshot when it matches the workbook, otherwise build the
+# catalog from whatever sheets are still current (see _build) and refresh the
+# snapshot for the next cold start (best effort: the deploy directory may be
+# read-only)
+def _load(path, workbook_hash, previous=None):
+    snapshot_dir = snapshot.snapshot_dir_for(path)
+    sheet_keys = _sheet_keys(path, workbook_hash)
+    with metrics.stage('catalog.open_snapshot'):
+        catalog = _open_snapshot_catalog(snapshot_dir, _catalog_version(sheet_keys))
+    if catalog is not None:
+        metrics.count('catalog.snapshot_hit')
+        return catalog
+    metrics.count('catalog.snapshot_miss')
+    with metrics.stage('catalog.build'):
+        catalog = _build(path, sheet_keys, snapshot_dir, previous)
+    try:
+        with metrics.stage('catalog.write_snapshot'):
+            _write_snapshot(snapshot_dir, catalog)
+    except (OSError, ValueError):
+        pass
+    return catalog
+
+
+# Return the Catalog ({sheet_name: BrandCatalog}) for the workbook, loading and indexing it at
+# most once per content version. A touched-but-unchanged file (new mtime, same
+# hash) keeps the cached catalog. It is shared between sessions: treat the
+# frames and indexes as read-only. Once the workbook is watched (see
+# watch_catalog) the watcher thread does the reloading, and this returns the
+# current catalog without checking the file.
+def load_catalog(file_path):
+    path = os.path.abspath(file_path)
+    if path in _watchers and path in _loaded:
+        return _loaded[path][1]
+    fingerprint = file_fingerprint(path)
+    with _lock:
+        cached = _loaded.get(path)
+        if cached is not None and cached[0][3] == fingerprint[3]:
+            return cached[1]
+        brands = _load(path, fingerprint[3], cached and cached[1])
+        _loaded[path] = (fingerprint, brands)
+        return brands
+
+
+# Background thread that polls one workbook and, when its contents change (or it
+# appears), parses and indexes the new version off the request path, then swaps
+# it in with a single assignment. Requests keep getting the previous catalog
+# until the new one is complete, and a session holding a catalog keeps a
+# consistent view of it. A workbook that fails to parse (e.g. caught half
+# copied) is retried on the next check while the old version keeps serving.
+class WorkbookWatcher(threading.Thread):
+    def __init__(self, path, interval=WATCH_INTERVAL):
+        super().__init__(name=f'catalog-watch:{os.path.basename(path)}', daemon=True)
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self._stopped = threading.Event()
+
+    # Load the workbook now if its contents differ from the served version;
+    # returns True when a new version was swapped in
+    def refresh(self):
+        fingerprint = file_fingerprint(self.path)
+        cached = _loaded.get(self.path)
+        if cached is not None and cached[0][3] == fingerprint[3]:
+            return False
+        catalog = _load(self.path, fingerprint[3], cached and cached[1]).warm()
+        with _lock:
+            _loaded[self.path] = (fingerprint, catalog)
+        self.reloads += 1
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.refresh()
+            except FileNotFoundError:
+                pass  # being replaced; keep serving the loaded version
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+
+    def stop(self):
+        self._stopped.set()
+
+
+# load_catalog() plus a WorkbookWatcher for the workbook (started once per
+# process), so a new or edited workbook is picked up without a restart
+def watch_catalog(file_path, interval=WATCH_INTERVAL):
+    path = os.path.abspath(file_path)
+    catalog = load_catalog(path)
+    with _lock:
+        if path not in _watchers:
+            _watchers[path] = WorkbookWatcher(path, interval)
+            _watchers[path].start()
+    return catalog
+
+
+# Return the Catalog last published into snapshot_dir (see build_snapshot),
+# without touching the workbook. This is how worker processes behind a load
+# balancer share one loader: numeric columns and index arrays are memory-mapped
+# read-only, so every process attached to a version shares one copy of them in
+# the page cache. Each call checks the manifest (one stat) and switches to a
+# newly published version; callers holding the previous Catalog keep a
+# consistent view of it.
+def attach_catalog(snapshot_dir):
+    snapshot_dir = os.path.abspath(snapshot_dir)
+    stat = os.stat(os.path.join(snapshot_dir, snapshot.MANIFEST))
+    identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _attached.get(snapshot_dir)
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+        catalog = _open_snapshot_catalog(snapshot_dir)
+        if catalog is None:
+            # Superseded while being read: keep serving the version we have
+            if cached is not None:
+                return cached[1]
+            raise FileNotFoundError(f'no published catalog in {snapshot_dir}')
+        if cached is not None and cached[1].version == catalog.version:
+            catalog = cached[1]
+        _attached[snapshot_dir] = (identity, catalog)
+        return catalog
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publish the cutter workbook as a memory-mapped snapshot '
+                                                 '(frames, indexes, equivalents) that workers attach to')
+    parser.add_argument('workbook', nargs='?', default='Cutter_Correlation_Chart5HF.xlsx')
+    parser.add_argument('--out', help='snapshot directory (default: <workbook>.snapshot next to the workbook)')
+    args = parser.parse_args()
+    manifest = build_snapshot(args.workbook, args.out)
+    for name, meta in manifest['sheets'].items():
+        print(f"{name}: {meta['rows']} rows, {len(meta['columns'])} columns, "
+              f"{len(meta['diagnostics'])} unreadable cells")
@@ -0,0 +1,153 @@
+import concurrent.futures
+import threading
+
+import numpy as np
+import pandas as pd
+
+from indexes import CategoryIndex, RangePairIndex, intersect
+from schemas import BRANDS, MATERIALS
+from units import INCHES, MM_PER_INCH, awg_to_mm, mm_to_awg
+
+# Cross-brand search. Every brand's cutting capacity is mapped onto the same
+# canonical dimensions (wire diameter in mm, AWG span, wire material) so one
+# query can be answered against all catalogs at once.
+
+# Purchase link column; older workbooks call it 'Buy Page'
+LINK_COLUMNS = ['Link_to_Purchase', 'Buy_Page']
+
+CANONICAL_COLUMNS = ['Brand', 'Part_Number', 'Cut', 'Material', 'Capacity_Low_mm', 'Capacity_High_mm',
+                     'AWG_Low', 'AWG_High', 'Link']
+
+
+def _as_float(column):
+    return column.astype('float64').to_numpy(dtype='float64', na_value=np.nan)
+
+
+# One brand's parts on the canonical dimensions, with indexes over them. Sheets
+# that give one capacity per material (EREM) contribute one record per material;
+# sheets without an AWG span get one derived from the diameter range.
+class CapacityTable:
+    def __init__(self, schema, df):
+        ranges = {r.key: r for r in schema.ranges}
+        link = next((c for c in LINK_COLUMNS if c in df.columns), None)
+        if schema.material_column:
+            sheet_material = df[schema.material_column].map(schema.materials).to_numpy(dtype=object)
+        else:
+            sheet_material = np.full(len(df), np.nan, dtype=object)
+
+        frames = []
+        for capacity in schema.capacities:
+            diameter = ranges[capacity.diameter]
+            scale = MM_PER_INCH if capacity.unit == INCHES else 1.0
+            low_mm = np.round(_as_float(df[diameter.low]) * scale, 6)
+            high_mm = np.round(_as_float(df[diameter.high]) * scale, 6)
+            if capacity.awg:
+                awg = ranges[capacity.awg]
+                awg_low, awg_high = _as_float(df[awg.low]), _as_float(df[awg.high])
+            else:
+                # A thicker wire has the smaller gauge number
+                awg_low, awg_high = mm_to_awg(high_mm), mm_to_awg(low_mm)
+            material = np.full(len(df), capacity.material, dtype=object) if capacity.material else sheet_material
+            frame = pd.DataFrame({
+                'Brand': schema.sheet_name,
+                'Part_Number': df[schema.part_number_column].to_numpy(),
+                'Cut': df[schema.cut_column].to_numpy(),
+                'Material': material,
+                'Capacity_Low_mm': low_mm,
+                'Capacity_High_mm': high_mm,
+                'AWG_Low': awg_low,
+                'AWG_High': awg_high,
+                'Link': df[link].to_numpy() if link else np.nan,
+                'Row': np.arange(len(df)),
+            })
+            frames.append(frame[~(np.isnan(low_mm) & np.isnan(high_mm))])
+        self.table = pd.concat(frames, ignore_index=True)
+
+        self.mm = RangePairIndex(self.table['Capacity_Low_mm'], self.table['Capacity_High_mm'])
+        self.awg = RangePairIndex(self.table['AWG_Low'], self.table['AWG_High'])
+        self.material = CategoryIndex(self.table['Material'])
+        # Parts whose sheet doesn't say which material they are rated for
+        self.any_material = np.flatnonzero(self.table['Material'].isna().to_numpy())
+
+    # Sorted ids into self.table matching every given constraint (None = all rows)
+    def query(self, diameters_mm=(), awg=None, material=None):
+        row_ids = [self.mm.query(value) for value in diameters_mm]
+        if awg is not None:
+            row_ids.append(self.awg.query(awg))
+        if material is not None:
+            row_ids.append(np.union1d(self.material.lookup(material), self.any_material))
+        return intersect(row_ids) if row_ids else None
+
+
+# Every brand's canonical records stacked into one table, built once per catalog.
+# Record ids index it; each brand's records start at its entry in offsets.
+class CapacityRecords:
+    def __init__(self, brands):
+        tables = [brand.capacity.table for brand in brands.values()]
+        self.offsets = np.cumsum([0] + [len(table) for table in tables[:-1]])
+        self.table = pd.concat([table[CANONICAL_COLUMNS] for table in tables], ignore_index=True)
+        self.low_mm = self.table['Capacity_Low_mm'].to_numpy()
+        self.high_mm = self.table['Capacity_High_mm'].to_numpy()
+        # Rank of each record's part number within its brand, a numeric sort key
+        self.part_rank = np.concatenate([
+            np.argsort(np.argsort(table['Part_Number'].astype(str).to_numpy(), kind='stable'))
+            for table in tables])
+
+    # Position of the brand each record id belongs to, in catalog order
+    def brand_of(self, ids):
+        return np.searchsorted(self.offsets, ids, side='right') - 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(BRANDS), thread_name_prefix='crossbrand')
+        return _pool
+
+
+# How comfortably each match covers the requested diameters: 1.0 when they sit in
+# the middle of the part's range, falling to 0.0 at either end of it (or beyond,
+# for a gauge converted to a diameter). low / high are the matched parts' ranges
+# in mm; each requested diameter is a number or an array with one value per part,
+# NaN where that part's query didn't give it.
+def fit_scores(low, high, diameters_mm):
+    if not len(diameters_mm):
+        return np.ones(len(low))
+    width = high - low
+    penalties = []
+    for value in diameters_mm:
+        value = np.asarray(value, dtype='float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            position = np.where(width > 0, (value - low) / width, 0.5)
+        penalties.append(np.where(np.isnan(value), np.nan, np.clip(np.abs(position - 0.5) * 2, 0, 1)))
+    penalties = np.array(penalties)
+    given = np.count_nonzero(~np.isnan(penalties), axis=0)
+    return 1 - np.nansum(penalties, axis=0) / np.maximum(given, 1)
+
+
+# Search every brand at once. mm / inches are wire diameters, awg a wire gauge
+# and material one of MATERIALS. Brands are queried in parallel and the merged
+# matches are ranked by fit, best first.
+def search_all_brands(brands, mm=None, inches=None, awg=None, material=None):
+    if material is not None and material not in MATERIALS:
+        raise ValueError(f'unknown material {material!r}; expected one of {MATERIALS}')
+    diameters_mm = [value for value in (mm, None if inches is None else inches * MM_PER_INCH) if value is not None]
+    fit_targets = diameters_mm + ([float(awg_to_mm(awg))] if awg is not None else [])
+
+    # Only record ids are gathered per brand; the records are copied once, in
+    # their final order, from the catalog's stacked table
+    def search(item):
+        offset, brand = item
+        row_ids = brand.capacity.query(diameters_mm, awg, material)
+        return offset + (np.arange(len(brand.capacity.table)) if row_ids is None else row_ids)
+
+    records = brands.records
+    ids = np.concatenate(list(_executor().map(search, zip(records.offsets, brands.values()))))
+    fit = np.round(fit_scores(records.low_mm[ids], records.high_mm[ids], fit_targets), 3)
+    order = np.lexsort((records.part_rank[ids], records.brand_of(ids), -fit))
+    return records.table.take(ids[order]).reset_index(drop=True).assign(Fit=fit[order])
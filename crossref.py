@@ -0,0 +1,100 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from crossbrand import CANONICAL_COLUMNS
+from indexes import PartNumberIndex, normalize_part_number
+
+# Competitor part-number cross-reference: find a part by a partial or mistyped
+# number in any brand, and list the closest parts other brands sell for the same
+# job (overlapping cutting capacity for a compatible wire material).
+
+HIT_COLUMNS = ['Brand', 'Part_Number', 'Match', 'Distance', 'Row']
+
+
+class PartSearch:
+    def __init__(self, brands, graph):
+        self._brands = brands
+        self._graph = graph
+        self._entries = [(name, row) for name, brand in brands.items() for row in range(len(brand.df))]
+        self._index = PartNumberIndex([brands[name].df[brands[name].schema.part_number_column].iat[row]
+                                       for name, row in self._entries])
+        self._brand_names = {normalize_part_number(name): name for name in brands}
+        # Each brand's rows are one run of entries: {brand: (start, stop)}
+        self._spans, start = {}, 0
+        for name, brand in brands.items():
+            self._spans[name] = (start, start + len(brand.df))
+            start += len(brand.df)
+        self._record_positions = {}
+
+    # Split a brand name typed along with the part number ('Swanstrom M401') off the query
+    def _split_brand(self, query):
+        words = query.split()
+        named = [self._brand_names[normalize_part_number(w)] for w in words
+                 if normalize_part_number(w) in self._brand_names]
+        rest = [w for w in words if normalize_part_number(w) not in self._brand_names]
+        return (named[0] if named else None), ' '.join(rest)
+
+    # (entry span of the brand to look in or None for all, the query without a
+    # typed brand name); a brand that does not exist has an empty span
+    def _scope(self, query, brand):
+        named_brand, query = self._split_brand(query)
+        brand = brand or named_brand
+        return (None if brand is None else self._spans.get(brand, (0, 0))), query
+
+    # (brand, row, match, distance) for every sheet row matching the query, only
+    # scoring the rows of `brand` when one is given
+    def _hits(self, query, brand):
+        span, query = self._scope(query, brand)
+        for position, match, distance in self._index.search(query, span):
+            name, row = self._entries[position]
+            yield name, row, match, distance
+
+    # Hits for a partial or mistyped part number across every brand (or only
+    # `brand`), one per part: exact matches first, then prefix matches, then
+    # near misses. Near misses are only looked for when the exact and prefix
+    # matches leave room under `limit`.
+    def search(self, query, brand=None, limit=20):
+        rows = {}
+        for name, row, match, distance in self._hits(query, brand):
+            part = self._brands[name].df[self._brands[name].schema.part_number_column].iat[row]
+            rows.setdefault((name, part), (name, part, match, distance, row))
+            if len(rows) == limit:
+                break
+        return pd.DataFrame(list(rows.values()), columns=HIT_COLUMNS)
+
+    # Sheet rows of `brand` matching the typed part number: the exact matches
+    # when there are any, otherwise every prefix / near-miss hit
+    def matching_rows(self, query, brand):
+        span, query = self._scope(query, brand)
+        positions = self._index.exact(query, span) or [position for position, _, _ in self._index.search(query, span)]
+        return np.sort(np.array([self._entries[position][1] for position in positions], dtype=np.intp))
+
+    # (brand, row, match, distance) of the parts a typed number most likely means:
+    # every exact match when there are any, otherwise the single best prefix /
+    # near-miss hit. Exact matches skip the typo-tolerant scan, which keeps bulk
+    # lookups of known part numbers cheap.
+    def best_matches(self, query):
+        span, rest = self._scope(query, None)
+        exact = [self._entries[position] + ('exact', 0) for position in self._index.exact(rest, span)]
+        return exact or list(itertools.islice(self._hits(query, None), 1))
+
+    # {sheet row: position of its first canonical record} of a brand, built on first use
+    def _records_of(self, name):
+        positions = self._record_positions.get(name)
+        if positions is None:
+            rows = self._brands[name].capacity.table['Row'].to_numpy()
+            unique_rows, first = np.unique(rows, return_index=True)
+            positions = self._record_positions[name] = dict(zip(unique_rows.tolist(), first.tolist()))
+        return positions
+
+    # Canonical records of the closest parts in other brands, best first, from
+    # the precomputed equivalence graph
+    def equivalents(self, brand, row):
+        neighbours = self._graph.neighbours(brand, row)
+        if not neighbours:
+            return pd.DataFrame(columns=CANONICAL_COLUMNS + ['Similarity'])
+        records = pd.concat([self._brands[name].capacity.table[CANONICAL_COLUMNS].iloc[[self._records_of(name)[other]]]
+                             for name, other, _ in neighbours], ignore_index=True)
+        return records.assign(Similarity=[round(score, 3) for _, _, score in neighbours])
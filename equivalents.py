@@ -0,0 +1,235 @@
+import argparse
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Cross-brand equivalence graph: for every part, the top-k parts of other brands
+# that cut the same wire. Built offline (or on first load) and stored in the
+# snapshot version as a small CSR-style .npz, so the app only has to look it up.
+
+TOP_K = 5
+GRAPH_FILE = 'equivalents.npz'
+
+# Bump when the scoring below changes so stored graphs are rebuilt
+SCORING_VERSION = 2
+
+# Weights of the similarity score: wire diameter overlap (covers the mm and inch
+# columns, which are the same quantity), AWG span overlap, same cut type
+DIAMETER_WEIGHT = 0.6
+AWG_WEIGHT = 0.25
+CUT_WEIGHT = 0.15
+
+# Derived AWG spans run to infinity for a zero lower diameter; cap them so
+# overlaps stay finite
+MAX_AWG = 60.0
+
+# Records of each other brand a record is compared with, per sort order (see build_graph)
+CANDIDATES = 64
+
+# Sources handled per block, to bound the memory of candidate pairs
+BLOCK_SIZE = 4096
+
+# Low 31 bits of a packed sort key: a candidate's score rank (see build_graph)
+_RANK_MASK = (1 << 31) - 1
+
+
+def _cut_key(cut):
+    return re.sub(r'[^a-z]', '', str(cut).lower()) if pd.notna(cut) else ''
+
+
+# Overlap of [low, high] ranges relative to their union (1.0 = identical)
+def _interval_similarity(low_a, high_a, low_b, high_b):
+    overlap = np.minimum(high_a, high_b) - np.maximum(low_a, low_b)
+    union = np.maximum(high_a, high_b) - np.minimum(low_a, low_b)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        similarity = np.where(union > 0, overlap / union, 1.0)
+    return np.nan_to_num(np.clip(similarity, 0.0, 1.0))
+
+
+# Best `k` (target, score) per source after keeping each pair's best score
+def _top_k(sources, targets, scores, k):
+    pairs = sources.astype(np.int64) * (int(targets.max(initial=0)) + 1) + targets
+    order = np.lexsort((-scores, pairs))
+    sources, targets, scores, pairs = sources[order], targets[order], scores[order], pairs[order]
+    first = np.ones(len(sources), dtype=bool)
+    first[1:] = pairs[1:] != pairs[:-1]
+    sources, targets, scores = sources[first], targets[first], scores[first]
+
+    order = np.lexsort((targets, -scores, sources))
+    sources, targets, scores = sources[order], targets[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]]) if len(sources) else np.empty(0, dtype=np.intp)
+    rank = np.arange(len(sources)) - np.repeat(starts, np.diff(np.r_[starts, len(sources)]))
+    keep = rank < k
+    return sources[keep], targets[keep], scores[keep]
+
+
+# Stored top-k substitutes per part, in CSR form: the substitutes of part p are
+# targets[offsets[p]:offsets[p + 1]] (part ids) with matching scores
+class EquivalenceGraph:
+    def __init__(self, brand_names, part_brands, part_rows, offsets, targets, scores):
+        self.brand_names = list(brand_names)
+        self.part_brands = part_brands
+        self.part_rows = part_rows
+        self.offsets = offsets
+        self.targets = targets
+        self.scores = scores
+        self._ids = {(self.brand_names[b], int(r)): i for i, (b, r) in enumerate(zip(part_brands, part_rows))}
+
+    # [(brand, row, score)] best first
+    def neighbours(self, brand, row):
+        part = self._ids.get((brand, row))
+        if part is None:
+            return []
+        span = slice(self.offsets[part], self.offsets[part + 1])
+        return [(self.brand_names[self.part_brands[t]], int(self.part_rows[t]), float(s))
+                for t, s in zip(self.targets[span], self.scores[span])]
+
+    def save(self, path, key):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.equivalents-', suffix='.npz', dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, key=np.array(key), brand_names=np.array(self.brand_names), part_brands=self.part_brands,
+                     part_rows=self.part_rows, offsets=self.offsets, targets=self.targets, scores=self.scores)
+        os.replace(tmp, path)
+
+    # The stored graph, or None when it is missing or was built for another key
+    @classmethod
+    def load(cls, path, key):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['key']) != key:
+                    return None
+                return cls(data['brand_names'].tolist(), data['part_brands'], data['part_rows'],
+                           data['offsets'], data['targets'], data['scores'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+# Integer sort keys of (first, second) pairs that order them lexicographically
+def _pair_keys(first, second):
+    first_rank = np.unique(first, return_inverse=True)[1].astype(np.int64)
+    second_rank = np.unique(second, return_inverse=True)[1].astype(np.int64)
+    return first_rank * (second_rank.max(initial=0) + 1) + second_rank
+
+
+# Build the graph from every brand's canonical capacity records. Diameter overlap
+# dominates the score, and ranges that overlap most have nearly the same lower
+# and upper bounds, so they sit close together when a brand's records are sorted
+# by (low, high) and again when sorted by (high, low). Each record is compared
+# with a fixed window of CANDIDATES records of every other brand around its own
+# position in both orders, so the build is O(n log n + n * CANDIDATES) rather
+# than a pass over every overlapping pair, which is quadratic when many ranges
+# overlap. Brands with at most CANDIDATES records are compared in full. Only
+# candidates whose diameter ranges overlap and whose materials are compatible
+# are scored.
+def build_graph(brands, k=TOP_K):
+    brand_names = list(brands)
+    records = pd.concat([brand.capacity.table.assign(Brand_Id=i) for i, brand in enumerate(brands.values())],
+                        ignore_index=True)
+    records = records[records['Capacity_Low_mm'].notna() & records['Capacity_High_mm'].notna()]
+
+    # Part ids: one per (brand, sheet row); EREM has one record per material
+    part_keys = records['Brand_Id'].to_numpy(dtype=np.int64) << 32 | records['Row'].to_numpy(dtype=np.int64)
+    unique_keys, part = np.unique(part_keys, return_inverse=True)
+    part = part.astype(np.int64)
+    part_brands = (unique_keys >> 32).astype(np.int16)
+    part_rows = (unique_keys & 0xFFFFFFFF).astype(np.int32)
+
+    low = records['Capacity_Low_mm'].to_numpy(dtype='float64')
+    high = records['Capacity_High_mm'].to_numpy(dtype='float64')
+    awg_low = np.clip(records['AWG_Low'].to_numpy(dtype='float64'), 0, MAX_AWG)
+    awg_high = np.clip(records['AWG_High'].to_numpy(dtype='float64'), 0, MAX_AWG)
+    brand = records['Brand_Id'].to_numpy()
+    material_codes, _ = pd.factorize(records['Material'].to_numpy())  # -1 = unknown, compatible with anything
+    cut_codes, _ = pd.factorize(records['Cut'].map(_cut_key).to_numpy())
+
+    keys = [_pair_keys(low, high), _pair_keys(high, low)]
+    found = []
+    for target_brand in range(len(brand_names)):
+        members = np.flatnonzero(brand == target_brand)
+        width = min(CANDIDATES, len(members))
+        # The brand's records in each order, with their keys
+        orders = [(members[np.argsort(key[members], kind='stable')], key) for key in keys]
+        orders = [(ordered, key, key[ordered]) for ordered, key in orders]
+        sources = np.flatnonzero(brand != target_brand)
+        for start in range(0, len(sources), BLOCK_SIZE):
+            block = sources[start:start + BLOCK_SIZE]
+            # Each source's window in both orders, moved inside the brand's records
+            j = np.hstack([ordered[np.clip(np.searchsorted(sorted_keys, key[block]) - width // 2, 0,
+                                           len(members) - width)[:, None] + np.arange(width)]
+                           for ordered, key, sorted_keys in orders])
+            i = block[:, None]
+
+            valid = (low[j] <= high[i]) & (low[i] <= high[j]) & (
+                (material_codes[i] < 0) | (material_codes[j] < 0) | (material_codes[i] == material_codes[j]))
+            score = (DIAMETER_WEIGHT * _interval_similarity(low[i], high[i], low[j], high[j])
+                     + AWG_WEIGHT * _interval_similarity(awg_low[i], awg_high[i], awg_low[j], awg_high[j])
+                     + CUT_WEIGHT * (cut_codes[i] == cut_codes[j]))
+            # Scores are >= 0, so their float32 bit patterns sort like the scores;
+            # 1 + bits leaves 0 for candidates that are not compatible
+            rank = np.where(valid, score.astype(np.float32).view(np.int32).astype(np.int64) + 1, 0)
+
+            # Per source, each target part once at its best score (packed sort keys
+            # of target, then score descending), then its best k by score, then
+            # lower target part, as _top_k orders them
+            packed = np.sort(part[j] << 31 | (_RANK_MASK - rank), axis=-1)
+            target, rank = packed >> 31, _RANK_MASK - (packed & _RANK_MASK)
+            rank[:, 1:][target[:, 1:] == target[:, :-1]] = 0
+            packed = (_RANK_MASK - rank) << 32 | target
+            if packed.shape[1] > k:
+                packed = np.partition(packed, k - 1, axis=-1)[:, :k]
+            target, rank = packed & 0xFFFFFFFF, _RANK_MASK - (packed >> 32)
+            kept = rank > 0
+            source = np.broadcast_to(part[block][:, None], kept.shape)[kept].astype(np.int32)
+            target = target[kept].astype(np.int32)
+            score = (rank[kept] - 1).astype(np.int32).view(np.float32)
+            # Similarity is symmetric: record the pair from both ends
+            found.append((np.r_[source, target], np.r_[target, source], np.r_[score, score]))
+        # Keep only each part's best k so far, to bound memory on large catalogs
+        found = [_top_k(*(np.concatenate(parts) for parts in zip(*found)), k)] if found else []
+
+    if found:
+        sources, targets, scores = found[0]
+    else:
+        sources = targets = np.empty(0, dtype=np.int32)
+        scores = np.empty(0, dtype=np.float32)
+    offsets = np.zeros(len(unique_keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(unique_keys)), out=offsets[1:])
+    return EquivalenceGraph(brand_names, part_brands, part_rows, offsets,
+                            targets.astype(np.int32), scores.astype(np.float32))
+
+
+def graph_key(catalog_version):
+    return f'{catalog_version}:{SCORING_VERSION}:{TOP_K}'
+
+
+# The stored graph for this catalog version, rebuilding (and storing, when the
+# directory is writable) if it is missing or out of date
+def load_or_build_graph(brands, path, catalog_version):
+    key = graph_key(catalog_version)
+    graph = EquivalenceGraph.load(path, key)
+    if graph is None:
+        graph = build_graph(brands)
+        try:
+            graph.save(path, key)
+        except OSError:
+            pass
+    return graph
+
+
+if __name__ == '__main__':
+    import catalog
+    import snapshot
+
+    parser = argparse.ArgumentParser(description='Precompute cross-brand equivalent parts for a workbook')
+    parser.add_argument('workbook', nargs='?', default='Cutter_Correlation_Chart5HF.xlsx')
+    args = parser.parse_args()
+    brands = catalog.load_catalog(args.workbook)
+    path = os.path.join(snapshot.version_dir(snapshot.snapshot_dir_for(args.workbook), brands.version), GRAPH_FILE)
+    graph = build_graph(brands)
+    graph.save(path, graph_key(brands.version))
+    print(f'{len(graph.part_rows)} parts, {len(graph.targets)} equivalents -> {path}')
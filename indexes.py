@@ -0,0 +1,406 @@
+import bisect
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+# Prebuilt lookup structures over a normalized brand sheet. Every lookup returns
+# a sorted array of row positions (row ids) into the sheet, so several filters
+# can be combined by intersecting ids and the frame is only sliced once.
+
+EMPTY = np.empty(0, dtype=np.intp)
+
+# intersect() probes a longer array by binary search when it is at least this many
+# times longer than the ids left, and through a boolean mask otherwise
+BINARY_SEARCH_RATIO = 16
+
+# Power-of-two width classes a RangePairIndex keeps below its widest rows
+MAX_WIDTH_CLASSES = 20
+
+# Keys a typo-tolerant part number lookup computes the edit distance of, the ones
+# sharing the most trigrams with the query
+MAX_FUZZY_CANDIDATES = 256
+
+
+# Column -> float ndarray with NaN for missing values (handles nullable int
+# columns). Narrow columns (float32, int16) stay 32-bit; wider ones are float64.
+def _as_float(column):
+    dtype = 'float32' if pd.api.types.is_numeric_dtype(column) and column.dtype.itemsize <= 4 else 'float64'
+    return column.astype(dtype).to_numpy(dtype=dtype, na_value=np.nan)
+
+
+# Point-in-range lookups over one (low, high) column pair.
+#
+# A row overlapping [start, end] has low <= end and, being at most w wide,
+# low >= start - w. Rows are grouped into power-of-two width classes (widths
+# under 2^-MAX_WIDTH_CLASSES of the widest share one class) and sorted by low
+# within each class, so in a class of widths up to W the candidates are one run
+# of lows in [start - W, end], found by binary search; only those are checked
+# against their high. Widths within a class differ by at most 2x, so the
+# candidates that turn out not to overlap are bounded by the rows that do: a
+# lookup costs O(classes * log n + hits) however the ranges are spread, instead
+# of a pass over a prefix or suffix of the sheet.
+#
+# Bounds keep the precision of their column, and query values are rounded to
+# the same precision before comparing, so a typed 0.1 matches a float32 0.1.
+class RangePairIndex:
+    def __init__(self, low, high):
+        self._low = _as_float(low)
+        self._high = _as_float(high)
+        # Rows with a missing bound can never match and are left out
+        valid = np.flatnonzero(~np.isnan(self._low) & ~np.isnan(self._high))
+        width = np.maximum(self._high[valid].astype('float64') - self._low[valid], 0)
+        # An infinite bound gives an unbounded width; those rows get a class of their own
+        width[np.isnan(width)] = np.inf
+        finite = np.isfinite(width)
+        exponent = np.frexp(np.where(finite, width, 0))[1]
+        top = exponent[finite].max(initial=0)
+        width_class = np.where(finite, np.maximum(exponent, top - MAX_WIDTH_CLASSES), top + 1)
+        order = np.lexsort((self._low[valid], width_class))
+        classes, starts = np.unique(width_class[order], return_index=True)
+        self._order = valid[order]
+        self._lows = self._low[self._order]
+        self._starts = np.append(starts, len(order)).astype(np.intp)
+        self._widths = np.array([width[order[lo:hi]].max() for lo, hi in zip(starts, self._starts[1:])])
+        lows, highs = self._low[valid], self._high[valid]
+        lows, highs = lows[np.isfinite(lows)], highs[np.isfinite(highs)]
+        self._extent = np.array([lows.min() if len(lows) else np.nan, highs.max() if len(highs) else np.nan],
+                                dtype='float64')
+
+    # The index as named arrays, for storing it in a snapshot
+    def to_arrays(self):
+        return {'low': self._low, 'high': self._high, 'order': self._order, 'lows': self._lows,
+                'starts': self._starts, 'widths': self._widths, 'extent': self._extent}
+
+    # Rebuild from to_arrays() output without sorting; memory-mapped arrays are
+    # used in place
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        for name, array in arrays.items():
+            setattr(index, '_' + name, array)
+        return index
+
+    def __len__(self):
+        return len(self._low)
+
+    # Sorted row ids whose [low, high] range contains value
+    def query(self, value):
+        return self.overlapping(value, value)
+
+    # (first candidate, end of candidates) into _order per width class for [start, end]
+    def _runs(self, start, end):
+        dtype = self._lows.dtype.type
+        runs = []
+        for lo, hi, width in zip(self._starts[:-1], self._starts[1:], self._widths):
+            # Probes in the column's own precision (a wider one would convert the
+            # whole column). The lower one is moved down by a few units in the last
+            # place and rounded down, so the rounding of high - low and of this
+            # subtraction cannot lose a candidate.
+            if math.isinf(width):
+                first = dtype(-np.inf)
+            else:
+                bound = float(start) - width - 2 * (np.spacing(abs(float(start))) + np.spacing(width))
+                first = dtype(bound)
+                if first > bound:
+                    first = np.nextafter(first, dtype(-np.inf))
+            lows = self._lows[lo:hi]
+            runs.append((lo + np.searchsorted(lows, first, side='left'), lo + np.searchsorted(lows, end, side='right')))
+        return runs
+
+    # Sorted row ids whose [low, high] range overlaps [start, end]
+    def overlapping(self, start, end):
+        start, end = self._low.dtype.type(start), self._low.dtype.type(end)
+        if math.isnan(start) or math.isnan(end):
+            return EMPTY
+        ids = [self._order[first:last] for first, last in self._runs(start, end) if first < last]
+        if not ids:
+            return EMPTY
+        ids = np.concatenate(ids)
+        return np.sort(ids[self._high[ids] >= start])
+
+    # Upper bound on the number of rows overlapping [start, end], by binary search
+    # alone: the candidates overlapping() would check
+    def candidates(self, start, end):
+        start, end = self._low.dtype.type(start), self._low.dtype.type(end)
+        return sum(max(last - first, 0) for first, last in self._runs(start, end))
+
+    # The given row ids whose [low, high] range overlaps [start, end], in their order
+    def within(self, ids, start, end):
+        start, end = self._low.dtype.type(start), self._low.dtype.type(end)
+        return ids[(self._low[ids] <= end) & (self._high[ids] >= start)]
+
+    # Distance from value to each given row's [low, high] range as float64: 0 where
+    # the range contains it, NaN where a bound is missing
+    def gaps(self, value, ids):
+        value = self._low.dtype.type(value)
+        return np.maximum(np.maximum(self._low[ids] - value, value - self._high[ids]), 0).astype('float64')
+
+    # (lowest low, highest high) over the finite bounds of rows with both; each NaN
+    # when there is none
+    def bounds(self):
+        low, high = self._extent
+        return float(low), float(high)
+
+    # Every (value position, row id) pair whose row range contains the value, for a
+    # whole array of values at once. The values are sorted once; the values inside
+    # a row's [low, high] range are then one contiguous run found by binary search,
+    # so the cost is O((n + m) log m + pairs) instead of one query per value.
+    def join(self, values):
+        values = np.asarray(values, dtype=self._low.dtype)
+        order = np.argsort(values, kind='stable')
+        order = order[:np.count_nonzero(~np.isnan(values))]
+        sorted_values = values[order]
+        # Rows in order of their low, as the pairs are listed
+        rows = np.sort(self._order)
+        rows = rows[np.argsort(self._low[rows], kind='stable')]
+        starts = np.searchsorted(sorted_values, self._low[rows], side='left')
+        ends = np.searchsorted(sorted_values, self._high[rows], side='right')
+        counts = np.maximum(ends - starts, 0)
+        total = counts.sum()
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        return order[np.repeat(starts, counts) + offsets], np.repeat(rows, counts)
+
+
+# The k rows nearest to a point in one or more range dimensions. targets holds
+# (RangePairIndex, value, scale) triples; a row's distance is the Euclidean norm of
+# its gaps to the values (see RangePairIndex.gaps), each divided by its scale so
+# that millimetres and gauges weigh alike. Rows missing a bound of any target are
+# never returned; allowed restricts the search to those sorted row ids.
+#
+# Rows at most r away have every scaled gap <= r, so they lie in the overlap of
+# one window per target: the narrowest window is found by binary search (see
+# overlapping) and its rows are checked against the other windows. Starting
+# from the gap to the index's overall bounds (no row can be nearer), the radius
+# doubles until the window holds k rows. The kth nearest of those is an upper
+# bound on the true kth distance, so one window of that radius holds every row
+# that can be among the k nearest. Only rows inside windows are measured, never
+# the whole sheet.
+#
+# Returns (row ids, distances, gaps with one row per target in its own unit),
+# nearest first, ties in row order.
+def nearest(targets, k, allowed=None):
+    scales = np.array([scale for _, _, scale in targets])[:, None]
+
+    # Row ids in the window: the narrowest target by index, the others by their bounds
+    def window(radius):
+        spans = [(index, value - radius * scale, value + radius * scale) for index, value, scale in targets]
+        spans.sort(key=lambda span: span[0].candidates(span[1], span[2]))
+        ids = spans[0][0].overlapping(spans[0][1], spans[0][2])
+        for index, start, end in spans[1:]:
+            ids = index.within(ids, start, end)
+        return ids if allowed is None else intersect([ids, allowed])
+
+    def measure(ids):
+        gaps = np.array([index.gaps(value, ids) for index, value, _ in targets]).reshape(len(targets), len(ids))
+        return gaps, np.sqrt(np.square(gaps / scales).sum(axis=0))
+
+    # Beyond `limit` every window already spans its whole index
+    radius, limit = 2.0 ** -10, 0.0
+    for index, value, scale in targets:
+        low, high = index.bounds()
+        radius = max(radius, (low - value) / scale, (value - high) / scale)
+        limit = max(limit, (high - value) / scale, (value - low) / scale)
+    ids = window(radius)
+    while len(ids) < k and radius < limit:
+        radius *= 2
+        ids = window(radius)
+
+    gaps, distances = measure(ids)
+    if len(ids) >= k:
+        # The window is a box and the distance is not, so rows nearer than the kth
+        # inside it may lie just outside. Widened by a hair so rounding at the
+        # window edges cannot drop a tie.
+        kth = np.partition(distances, k - 1)[k - 1]
+        ids = window(kth * (1 + 1e-6) + 1e-12)
+        gaps, distances = measure(ids)
+    order = np.argsort(distances, kind='stable')[:k]
+    return ids[order], distances[order], gaps[:, order]
+
+
+# Intersect several sorted row-id arrays. The smallest is narrowed by each of the
+# others in turn, so the result is never re-sorted: against a much longer array
+# by binary search (O(k log m)), otherwise by marking the longer array's ids in a
+# boolean mask and testing the survivors against it (O(k + m)).
+def intersect(id_arrays):
+    id_arrays = sorted(id_arrays, key=len)
+    ids = id_arrays[0]
+    for other in id_arrays[1:]:
+        if not len(ids):
+            break
+        ids = _contained(ids, other)
+    return ids
+
+
+# The sorted ids that also occur in the sorted array other
+def _contained(ids, other):
+    if not len(other):
+        return ids[:0]
+    if len(ids) * BINARY_SEARCH_RATIO < len(other):
+        positions = np.minimum(np.searchsorted(other, ids), len(other) - 1)
+        return ids[other[positions] == ids]
+    marked = np.zeros(max(ids[-1], other[-1]) + 1, dtype=bool)
+    marked[other] = True
+    return ids[marked[ids]]
+
+
+# Inverted index over one categorical column: value -> sorted row ids, plus the
+# sorted option list for the column's dropdown, both computed once at load time
+class CategoryIndex:
+    def __init__(self, column):
+        codes, uniques = pd.factorize(column)
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        # Missing values get code -1 and sort first; skip past them
+        start = len(codes) - counts.sum()
+        bounds = np.cumsum(counts) + start
+        self._set_rows(order, uniques.tolist(), np.concatenate(([start], bounds[:-1])).astype(np.intp), bounds)
+
+    def _set_rows(self, order, values, starts, ends):
+        self._order, self._starts, self._ends = order, starts, ends
+        self._rows = {value: order[lo:hi] for value, lo, hi in zip(values, starts, ends)}
+        self.options = sorted(self._rows)
+
+    # The index as named arrays, for storing it in a snapshot (text values only)
+    def to_arrays(self):
+        values = list(self._rows)
+        if not all(isinstance(value, str) for value in values):
+            raise ValueError('only indexes over text values can be stored')
+        return {'order': self._order, 'values': np.array(values, dtype=str),
+                'starts': self._starts, 'ends': self._ends}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index._set_rows(arrays['order'], arrays['values'].tolist(), arrays['starts'], arrays['ends'])
+        return index
+
+    # Sorted row ids where the column equals value
+    def lookup(self, value):
+        return self._rows.get(value, EMPTY)
+
+
+_NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]')
+
+
+# Canonical form for comparing part numbers: upper case, letters and digits only
+def normalize_part_number(text):
+    return _NON_ALPHANUMERIC.sub('', str(text).upper())
+
+
+def _trigrams(key):
+    padded = f'^{key}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Levenshtein distance, giving up (returning limit + 1) once it must exceed limit
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+# Prefix and typo-tolerant lookup over part numbers. Each part is indexed under its
+# whole number and under each '/'-separated alternative ('7145E/7245E'). Keys are
+# kept sorted for prefix search by binary search, and a trigram inverted index
+# narrows typo-tolerant matches down to a few candidates before edit distance is
+# computed. Lookups return positions in the part_numbers sequence given; `owners`
+# (start, stop) keeps only the positions in that range.
+class PartNumberIndex:
+    def __init__(self, part_numbers):
+        keys = []
+        for position, part in enumerate(part_numbers):
+            if pd.isna(part):
+                continue
+            text = str(part)
+            variants = {normalize_part_number(text)} | {normalize_part_number(p) for p in text.split('/')}
+            keys.extend((key, position) for key in variants if key)
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._owners = np.array([position for _, position in keys], dtype=np.intp)
+        self._lengths = np.array([len(key) for key in self._keys], dtype=np.intp)
+
+        postings = {}
+        gram_counts = []
+        for slot, key in enumerate(self._keys):
+            grams = _trigrams(key)
+            gram_counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(slot)
+        self._postings = {gram: np.array(slots, dtype=np.intp) for gram, slots in postings.items()}
+        self._gram_counts = np.array(gram_counts, dtype=np.intp)
+
+    def _owners_of(self, slots, owners=None):
+        found = self._owners[slots]
+        if owners is not None:
+            found = found[(found >= owners[0]) & (found < owners[1])]
+        return list(dict.fromkeys(found.tolist()))
+
+    def exact(self, query, owners=None):
+        key = normalize_part_number(query)
+        return self._owners_of(slice(bisect.bisect_left(self._keys, key), bisect.bisect_right(self._keys, key)),
+                               owners)
+
+    def prefix(self, query, owners=None):
+        key = normalize_part_number(query)
+        if not key:
+            return []
+        start, end = bisect.bisect_left(self._keys, key), bisect.bisect_right(self._keys, key + '~')
+        # Shortest completions first: 'M401' ranks 'M401C' ahead of 'M4011C'
+        slots = start + np.argsort(self._lengths[start:end], kind='stable')
+        return self._owners_of(slots, owners)
+
+    # [(position, distance)] within max_distance edits, closest first
+    def fuzzy(self, query, max_distance=None, owners=None):
+        key = normalize_part_number(query)
+        if not key:
+            return []
+        if max_distance is None:
+            max_distance = 1 if len(key) <= 4 else 2 if len(key) <= 8 else 3
+        grams = _trigrams(key)
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return []
+        shared = np.bincount(np.concatenate(lists), minlength=len(self._keys))
+        # One edit destroys at most three trigrams of either key, and changes the
+        # length by at most one
+        candidate = ((shared >= np.maximum(1, np.maximum(len(grams), self._gram_counts) - 3 * max_distance))
+                     & (np.abs(self._lengths - len(key)) <= max_distance))
+        if owners is not None:
+            candidate &= (self._owners >= owners[0]) & (self._owners < owners[1])
+        slots = np.flatnonzero(candidate)
+        if len(slots) > MAX_FUZZY_CANDIDATES:
+            slots = np.sort(slots[np.argsort(-shared[slots], kind='stable')[:MAX_FUZZY_CANDIDATES]])
+        best = {}
+        for slot in slots.tolist():
+            distance = edit_distance(key, self._keys[slot], max_distance)
+            owner = int(self._owners[slot])
+            if distance <= max_distance and distance < best.get(owner, max_distance + 1):
+                best[owner] = distance
+        return sorted(best.items(), key=lambda item: (item[1], item[0]))
+
+    # (position, match, distance): exact matches, then prefix matches, then near
+    # misses. Each kind is only looked up once the ones before it are used up, so
+    # a caller that stops early never pays for the typo-tolerant scan.
+    def search(self, query, owners=None):
+        seen = set()
+        for position in self.exact(query, owners):
+            seen.add(position)
+            yield position, 'exact', 0
+        for position in self.prefix(query, owners):
+            if position not in seen:
+                seen.add(position)
+                yield position, 'prefix', 0
+        for position, distance in self.fuzzy(query, owners=owners):
+            if position not in seen:
+                seen.add(position)
+                yield position, 'fuzzy', distance
@@ -0,0 +1,179 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Opt-in instrumentation of the hot paths: how long each stage (parsing a sheet,
+# normalizing, building indexes, filtering, rendering a table, ...) took, how
+# much memory it allocated, and how often the caches hit. Off unless the
+# CUTTER_METRICS environment variable is set:
+#
+#   CUTTER_METRICS=1        time every stage
+#   CUTTER_METRICS=memory   also trace the memory each stage allocates (tracemalloc
+#                           slows every allocation, so timings come out higher)
+#
+# Stages are recorded into the process-wide totals and into the current run (one
+# Streamlit rerun or one API request) of the calling thread. A finished run is
+# logged as one JSON line on the 'cutter.metrics' logger (stderr by default), and
+# the totals are exported as Prometheus text (see prometheus_text).
+#
+# When disabled, stage() hands back a shared do-nothing context manager and
+# count() returns at once, so instrumented code pays one function call.
+
+_setting = os.environ.get('CUTTER_METRICS', '').strip().lower()
+enabled = _setting not in ('', '0', 'false', 'no', 'off')
+tracing = enabled and _setting == 'memory'
+
+log = logging.getLogger('cutter.metrics')
+
+_lock = threading.Lock()
+_local = threading.local()
+_totals = {}    # stage -> [calls, seconds, allocated bytes]
+_counters = {}  # event -> count
+_caches = {}    # cache name -> stats() callable (see cache.LRUCache.stats)
+
+_DISABLED = contextlib.nullcontext()
+
+if enabled:
+    if tracing:
+        tracemalloc.start()
+    if not log.handlers:
+        log.addHandler(logging.StreamHandler(sys.stderr))
+        log.setLevel(logging.INFO)
+
+
+# The stages of one rerun or request, in the order they started. Each is a dict
+# with the stage name, its nesting depth, seconds and allocated bytes (None when
+# memory is not traced).
+class Run:
+    def __init__(self, label):
+        self.label = label
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.stages = []
+        self.depth = 0
+
+    def as_dict(self):
+        return {'run': self.label, 'started': self.started, 'seconds': self.seconds, 'stages': self.stages,
+                'caches': cache_stats()}
+
+
+class _Stage:
+    __slots__ = ('name', 'run', 'entry', 'start', 'memory')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.run = getattr(_local, 'run', None)
+        if self.run is not None:
+            self.entry = {'stage': self.name, 'depth': self.run.depth, 'seconds': None, 'allocated_bytes': None}
+            self.run.stages.append(self.entry)
+            self.run.depth += 1
+        self.memory = tracemalloc.get_traced_memory()[0] if tracing else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        allocated = tracemalloc.get_traced_memory()[0] - self.memory if tracing else None
+        with _lock:
+            totals = _totals.setdefault(self.name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += allocated or 0
+        if self.run is not None:
+            self.run.depth -= 1
+            self.entry['seconds'] = seconds
+            self.entry['allocated_bytes'] = allocated
+        return False
+
+
+# Context manager timing the enclosed block as stage `name`
+def stage(name):
+    return _Stage(name) if enabled else _DISABLED
+
+
+# Count one occurrence of an event (e.g. a catalog reload)
+def count(event):
+    if enabled:
+        with _lock:
+            _counters[event] = _counters.get(event, 0) + 1
+
+
+# Report a cache's hit counters with the metrics; stats() returns a dict with at
+# least 'hits' and 'misses'. Caches are reported whether or not timing is on.
+def register_cache(name, stats):
+    _caches[name] = stats
+
+
+def cache_stats():
+    return {name: stats() for name, stats in _caches.items()}
+
+
+# Start recording the calling thread's stages as a new run
+def begin_run(label):
+    if enabled:
+        _local.run = Run(label)
+
+
+# Finish the calling thread's run, log it, and return it (None when disabled or
+# no run was begun)
+def end_run():
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return None
+    _local.run = None
+    run.seconds = time.perf_counter() - run.start
+    log.info(json.dumps(run.as_dict(), default=str))
+    return run
+
+
+# {stage: {'calls', 'seconds', 'allocated_bytes'}} since the process started
+def totals():
+    with _lock:
+        return {name: {'calls': calls, 'seconds': seconds, 'allocated_bytes': allocated if tracing else None}
+                for name, (calls, seconds, allocated) in _totals.items()}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Totals, event counts and cache counters in the Prometheus text exposition format
+def prometheus_text():
+    lines = ['# HELP cutter_metrics_enabled Whether stage instrumentation is on (CUTTER_METRICS)',
+             '# TYPE cutter_metrics_enabled gauge',
+             f'cutter_metrics_enabled {int(enabled)}']
+    stages = totals()
+    if stages:
+        lines += ['# HELP cutter_stage_seconds Time spent in each instrumented stage',
+                  '# TYPE cutter_stage_seconds summary']
+        for name, stage_totals in stages.items():
+            lines.append(f'cutter_stage_seconds_sum{{stage="{_label(name)}"}} {stage_totals["seconds"]:.6f}')
+            lines.append(f'cutter_stage_seconds_count{{stage="{_label(name)}"}} {stage_totals["calls"]}')
+        if tracing:
+            lines += ['# HELP cutter_stage_allocated_bytes Memory allocated (net) in each instrumented stage',
+                      '# TYPE cutter_stage_allocated_bytes summary']
+            for name, stage_totals in stages.items():
+                lines.append(f'cutter_stage_allocated_bytes_sum{{stage="{_label(name)}"}} '
+                             f'{stage_totals["allocated_bytes"]}')
+                lines.append(f'cutter_stage_allocated_bytes_count{{stage="{_label(name)}"}} {stage_totals["calls"]}')
+    with _lock:
+        events = dict(_counters)
+    if events:
+        lines += ['# HELP cutter_events_total Occurrences of instrumented events', '# TYPE cutter_events_total counter']
+        lines += [f'cutter_events_total{{event="{_label(name)}"}} {value}' for name, value in events.items()]
+    caches = cache_stats()
+    for field, kind in [('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'), ('size', 'gauge')]:
+        values = {name: stats[field] for name, stats in caches.items() if field in stats}
+        if values:
+            metric = f'cutter_cache_{field}_total' if kind == 'counter' else f'cutter_cache_{field}'
+            lines += [f'# HELP {metric} Cache {field} per cache', f'# TYPE {metric} {kind}']
+            lines += [f'{metric}{{cache="{_label(name)}"}} {value}' for name, value in values.items()]
+    return '\n'.join(lines) + '\n'
@@ -1,11 +1,30 @@
-import pandas as pd
+import functools
+import io
+import os
+
 import streamlit as st
-import openpyxl
 from PIL import Image
 
+import metrics
+from batch import match_bom, read_bom, write_csv, write_excel
+from catalog import attach_catalog, watch_catalog
+from query import ALL_BRANDS, nearest_all_brands, nearest_brand, parse_value, query_all_brands, query_brand
+from schemas import BRANDS, MATERIALS
+from units import widen_floats
+
+# Time this rerun's stages when instrumentation is on (CUTTER_METRICS, see metrics.py)
+metrics.begin_run('rerun')
+
+# Images are decoded once per process and shared by every session and rerun
+@st.cache_resource(show_spinner=False)
+def load_image(path):
+    image = Image.open(path)
+    image.load()
+    return image
+
 # Image Variables
-icon = Image.open('PTLogo.jpeg')  # Original icon
-sidebar_image = Image.open('PTLogo3.png')  # New image for the sidebar
+icon = load_image('PTLogo.jpeg')  # Original icon
+sidebar_image = load_image('PTLogo3.png')  # New image for the sidebar
 
 # Set Page width and Title
 st.set_page_config(page_title="Practical Tools Cutter Correlation Chart", page_icon=icon, layout="wide")
@@ -25,81 +44,86 @@ st.markdown(hide_default_format, unsafe_allow_html=True)
 # Display the logo at the top of the sidebar
 st.sidebar.image(sidebar_image, use_column_width=True)
 
-# Load the data from the Excel file
-file_path = 'Cutter_Correlation_Chart5HF.xlsx'  # Replace with your file path
-
-# Define a function to process each sheet
-def load_and_process_sheet(sheet_name):
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
-
-    # Strip leading/trailing whitespaces from column names and normalize
-    df.columns = df.columns.str.strip().str.replace('\n', ' ').str.replace('\r', '').str.replace(' ', '_')
-
-    if sheet_name == 'Excelta':
-        if 'Size' in df.columns:
-            df['Size'] = df['Size'].str.strip().str.title()
-        if 'Millimeter_Low' in df.columns:
-            df['Millimeter_Low'] = df['Millimeter_Low'].str.replace('mm', '').astype(float)
-        if 'Millimeter_High' in df.columns:
-            df['Millimeter_High'] = df['Millimeter_High'].str.replace('mm', '').astype(float)
-        if 'Inches_Low' in df.columns:
-            df['Inches_Low'] = df['Inches_Low'].str.replace('"', '').astype(float)
-        if 'Inches_High' in df.columns:
-            df['Inches_High'] = df['Inches_High'].str.replace('"', '').astype(float)
-        if 'AWG_High' in df.columns:
-            df['AWG_High'] = df['AWG_High'].str.replace('AWG', '').astype(int)
-        if 'AWG_Low' in df.columns:
-            df['AWG_Low'] = df['AWG_Low'].str.replace('AWG', '').astype(int)
-    elif sheet_name == 'ideal-tek':
-        if 'Head_Width_Millimeter' in df.columns:
-            df['Head_Width_Millimeter'] = df['Head_Width_Millimeter'].str.replace('mm', '').astype(float)
-        if 'Head_Width__inches' in df.columns:
-            df['Head_Width__inches'] = df['Head_Width__inches'].str.replace('"', '').astype(float)
-        if 'Lowest_Cutting_Capacity_Millimeter' in df.columns:
-            df['Lowest_Cutting_Capacity_Millimeter'] = df['Lowest_Cutting_Capacity_Millimeter'].str.replace('mm', '').astype(float)
-        if 'Highest_Cutting_Capacity__Millimeter' in df.columns:
-            df['Highest_Cutting_Capacity__Millimeter'] = df['Highest_Cutting_Capacity__Millimeter'].str.replace('mm', '').astype(float)
-        if 'Highest_AWG' in df.columns:
-            df['Highest_AWG'] = pd.to_numeric(df['Highest_AWG'].str.replace('AWG', ''), errors='coerce').astype('Int64')
-        if 'Lowest_AWG' in df.columns:
-            df['Lowest_AWG'] = pd.to_numeric(df['Lowest_AWG'].str.replace('AWG', ''), errors='coerce').astype('Int64')
-        if 'OAL_Millimeter' in df.columns:
-            df['OAL_Millimeter'] = df['OAL_Millimeter'].str.replace('mm', '').astype(float)
-        if 'OAL__inches' in df.columns:
-            df['OAL__inches'] = df['OAL__inches'].str.replace('"', '').astype(float)
-    elif sheet_name == 'Swanstrom':
-        if 'Lowest_Cutting_Capacity_Inches' in df.columns:
-            df['Lowest_Cutting_Capacity_Inches'] = df['Lowest_Cutting_Capacity_Inches'].str.replace('"', '').astype(float)
-        if 'Highest_Cutting_Capacity_Inches' in df.columns:
-            df['Highest_Cutting_Capacity_Inches'] = df['Highest_Cutting_Capacity_Inches'].str.replace('"', '').astype(float)
-        if 'AWG_Low' in df.columns:
-            df['AWG_Low'] = pd.to_numeric(df['AWG_Low'].str.replace('AWG', '').str.replace('AWH', ''), errors='coerce').astype('Int64')
-        if 'AWG_High' in df.columns:
-            df['AWG_High'] = pd.to_numeric(df['AWG_High'].str.replace('AWG', '').str.replace('AWH', ''), errors='coerce').astype('Int64')
-    elif sheet_name == 'EREM':
-        if 'Cutting_Capacity_Copper_Low' in df.columns:
-            df['Cutting_Capacity_Copper_Low'] = df['Cutting_Capacity_Copper_Low'].str.replace('"', '').astype(float)
-        if 'Cutting_Capacity_Copper_High' in df.columns:
-            df['Cutting_Capacity_Copper_High'] = df['Cutting_Capacity_Copper_High'].str.replace('"', '').astype(float)
-        if 'Cutting_Capacity_Medium_Wire_Low' in df.columns:
-            df['Cutting_Capacity_Medium_Wire_Low'] = df['Cutting_Capacity_Medium_Wire_Low'].str.replace('"', '').astype(float)
-        if 'Cutting_Capacity_Medium_Wire_High' in df.columns:
-            df['Cutting_Capacity_Medium_Wire_High'] = df['Cutting_Capacity_Medium_Wire_High'].str.replace('"', '').astype(float)
-        if 'Cutting_Capacity_Hard_Wire_Low' in df.columns:
-            df['Cutting_Capacity_Hard_Wire_Low'] = df['Cutting_Capacity_Hard_Wire_Low'].str.replace('"', '').astype(float)
-        if 'Cutting_Capacity_Hard_Wire_High' in df.columns:
-            df['Cutting_Capacity_Hard_Wire_High'] = df['Cutting_Capacity_Hard_Wire_High'].str.replace('"', '').astype(float)
-    return df
-
-# Function to create display-friendly column names
-def get_display_column_mapping(df):
-    return {col: col.replace('_', ' ') for col in df.columns}
-
-# Load all sheets
-df_excelta = load_and_process_sheet('Excelta')
-df_idealtek = load_and_process_sheet('ideal-tek')
-df_swanstrom = load_and_process_sheet('Swanstrom')
-df_erem = load_and_process_sheet('EREM')
+# Load the data from the Excel file (set CUTTER_WORKBOOK to serve another one)
+file_path = os.environ.get('CUTTER_WORKBOOK', 'Cutter_Correlation_Chart5HF.xlsx')
+
+# Function to create display-friendly column names (computed once per set of columns, i.e. per brand)
+@functools.lru_cache(maxsize=64)
+def get_display_column_mapping(columns):
+    return {col: col.replace('_', ' ') for col in columns}
+
+# Left-aligned headers and cells for every results table
+TABLE_STYLES = [dict(selector='th', props=[('text-align', 'left')])]
+CELL_PROPERTIES = {'text-align': 'left'}
+
+PAGE_SIZES = [25, 50, 100, 250]
+DEFAULT_PAGE_SIZE = 100
+
+# Show a results table one page at a time: only the visible slice is renamed,
+# styled and sent to the browser, however many rows matched
+def show_table(df, key):
+    page_size, page = DEFAULT_PAGE_SIZE, 1
+    if len(df) > PAGE_SIZES[0]:
+        size_column, page_column, count_column = st.columns([1, 1, 2])
+        page_size = size_column.selectbox('Rows per page', PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE),
+                                          key=f'{key}_page_size')
+        pages = -(-len(df) // page_size)
+        # Keyed on the result size too, so a new result starts again at page 1
+        page = page_column.number_input(f'Page (of {pages})', min_value=1, max_value=pages, value=1,
+                                        key=f'{key}_page_{len(df)}_{page_size}')
+        start = (page - 1) * page_size
+        count_column.caption(f'Rows {start + 1}-{min(start + page_size, len(df))} of {len(df)}')
+
+    with metrics.stage('app.render'):
+        visible = widen_floats(df.iloc[(page - 1) * page_size:page * page_size])
+        visible = visible.rename(columns=get_display_column_mapping(tuple(df.columns)))
+
+        # Apply some styling to the DataFrame, and formatting to remove extra zeros
+        styled = visible.style.set_properties(**CELL_PROPERTIES).set_table_styles(TABLE_STYLES)
+        st.dataframe(styled.format(precision=3, na_rep=''), width=2000)
+
+# Text that is a number being typed: a lone '-', '0.', '1e', '1e-'
+def _partial_number(text, value_type):
+    text = text.strip()
+    if not text.endswith(('-', '.', 'e', 'E')):
+        return False
+    text = text[:-1]
+    return not text.strip() or parse_value(text, value_type) is not None or _partial_number(text, value_type)
+
+# A numeric filter typed into a text box: None when empty or not a number. A number
+# still being typed keeps the session filtering by the last number the box held, so
+# a half-typed value does not throw away the current results. `scope` keeps boxes
+# with the same label apart, e.g. the same dimension of two brands.
+def numeric_input(container, label, value_type, scope):
+    key = f'{scope}: {label}'
+    text = container.text_input(label, key=key)
+    remembered = f'last value: {key}'
+    value = parse_value(text, value_type)
+    if value is not None:
+        st.session_state[remembered] = value
+        return value
+    if not _partial_number(text, value_type):
+        st.session_state.pop(remembered, None)
+        return None
+    value = st.session_state.get(remembered)
+    kept = '' if value is None else f'; still filtering by {value}'
+    container.caption(f'"{text}" is not a number yet{kept}')
+    return value
+
+# Match an uploaded BOM once per file and catalog version, not on every rerun
+@st.cache_data(max_entries=4, show_spinner='Matching BOM...')
+def match_uploaded_bom(contents, file_name, top, catalog_version, _brands):
+    return match_bom(_brands, read_bom(io.BytesIO(contents), file_name), top=top)
+
+# The catalog of all sheets and their indexes (built once per process and shared across sessions). A brand's sheet
+# is only opened the first time it is viewed, so a new session pays for the brand it shows, not all four. A
+# background watcher re-indexes the workbook when it changes and swaps the new version in; this rerun keeps the
+# catalog it got here.
+# When several app processes run behind a load balancer, publish the workbook once with `python catalog.py`
+# and point CUTTER_SNAPSHOT at the snapshot directory: every process then maps the same published catalog.
+snapshot_dir = os.environ.get('CUTTER_SNAPSHOT')
+with metrics.stage('app.catalog'):
+    brands = attach_catalog(snapshot_dir) if snapshot_dir else watch_catalog(file_path)
 
 # Custom CSS to widen the data tables
 st.markdown(
@@ -125,179 +149,86 @@ st.subheader('Select Tool Parameters from the Sidebar')
 st.sidebar.header('Filter Options')
 
 # Allow the user to select which sheet to view
-sheet_selection = st.sidebar.selectbox('Select Brand', ['Excelta', 'ideal-tek', 'Swanstrom', 'EREM'])
-
-# Select the appropriate DataFrame based on the user's choice
-if sheet_selection == 'Excelta':
-    df = df_excelta
-    part_number_column = 'Part_#'
-elif sheet_selection == 'ideal-tek':
-    df = df_idealtek
-    part_number_column = 'Part_Number'
-elif sheet_selection == 'Swanstrom':
-    df = df_swanstrom
-    part_number_column = 'Model_#'
-elif sheet_selection == 'EREM':
-    df = df_erem
+sheet_selection = st.sidebar.selectbox('Select Brand', list(BRANDS) + [ALL_BRANDS])
+
+if sheet_selection == ALL_BRANDS:
+    # One query across every catalog, matched on wire size rather than brand-specific columns
+    st.sidebar.subheader('Wire to Cut')
+    selected_material = st.sidebar.selectbox('Select Wire Material', ['None'] + MATERIALS, index=0)
+    mm = numeric_input(st.sidebar, 'Enter Millimeter Value', float, ALL_BRANDS)
+    inches = numeric_input(st.sidebar, 'Enter Inches Value', float, ALL_BRANDS)
+    awg = numeric_input(st.sidebar, 'Enter AWG Value', int, ALL_BRANDS)
+
+    # Partial or mistyped numbers from any brand, e.g. '170E' or 'Swanstrom M401'
+    st.sidebar.subheader('Direct Part Search')
+    part_number_input = st.sidebar.text_input('Enter Part Number (if known)')
+
+    material = None if selected_material == 'None' else selected_material
+    filtered_df = query_all_brands(
+        brands,
+        mm=mm,
+        inches=inches,
+        awg=awg,
+        material=material,
+        part_number=part_number_input,
+    )
     part_number_column = 'Part_Number'
-
-# Get unique values for dropdowns based on selected sheet
-if sheet_selection == 'Excelta':
-    head_shapes = ['None'] + sorted(df['Size'].dropna().unique().tolist())
-    types_of_cut = ['None'] + sorted(df['Cut'].dropna().unique().tolist())
-    material_strengths = ['None'] + sorted(df['Wire'].dropna().unique().tolist())
-
-    st.sidebar.subheader('Filter by Attributes')
-    # User selections
-    selected_head_shape = st.sidebar.selectbox('Select Head Shape', head_shapes, index=0)
-    selected_type_of_cut = st.sidebar.selectbox('Select Type of Cut', types_of_cut, index=0)
-    selected_material_strength = st.sidebar.selectbox('Select Material Strength', material_strengths, index=0)
-elif sheet_selection == 'ideal-tek':
-    cutter_hardness = ['None'] + sorted(df['Type'].dropna().unique().tolist())
-    head_shapes = ['None'] + sorted(df['Head_Shape'].dropna().unique().tolist())
-    head_sizes = ['None'] + sorted(df['Head_Size'].dropna().unique().tolist())
-    types_of_cut = ['None'] + sorted(df['Cutting_Edge'].dropna().unique().tolist())
-
-    st.sidebar.subheader('Filter by Attributes')
-    # User selections
-    selected_cutter_hardness = st.sidebar.selectbox('Select Cutter Hardness', cutter_hardness, index=0)
-    selected_head_shape = st.sidebar.selectbox('Select Head Shape', head_shapes, index=0)
-    selected_head_size = st.sidebar.selectbox('Select Head Size', head_sizes, index=0)
-    selected_type_of_cut = st.sidebar.selectbox('Select Type of Cut', types_of_cut, index=0)
-elif sheet_selection == 'Swanstrom':
-    types_of_cut = ['None'] + sorted(df['Cut'].dropna().unique().tolist())
-    material_strengths = ['None'] + sorted(df['Type_of_Cut'].dropna().unique().tolist())
-
-    st.sidebar.subheader('Filter by Attributes')
-    # User selections
-    selected_type_of_cut = st.sidebar.selectbox('Select Type of Cut', types_of_cut, index=0)
-    selected_material_strength = st.sidebar.selectbox('Select Material Strength', material_strengths, index=0)
-elif sheet_selection == 'EREM':
-    series_of_cutters = ['None'] + sorted(df['Series_of_Cutter'].dropna().unique().tolist())
-    types_of_cut = ['None'] + sorted(df['Cut_Type'].dropna().unique().tolist())
-
-    st.sidebar.subheader('Filter by Attributes')
-    # User selections
-    selected_series_of_cutter = st.sidebar.selectbox('Select Series of Cutter', series_of_cutters, index=0)
-    selected_type_of_cut = st.sidebar.selectbox('Select Type of Cut', types_of_cut, index=0)
-
-# Option to enter part number directly
-st.sidebar.subheader('Direct Part Search')
-part_number_input = st.sidebar.text_input('Enter Part Number (if known)')
-
-# Show appropriate dimension filters based on sheet selection
-st.sidebar.subheader('Dimension Filters')
-if sheet_selection != 'EREM':
-    if sheet_selection != 'Swanstrom':
-        mm_input = st.sidebar.text_input('Enter Millimeter Value')
-    inches_input = st.sidebar.text_input('Enter Inches Value')
-    awg_input = st.sidebar.text_input('Enter AWG Value')
+    # Closest wire fits if nothing matches; a part number search has its own fuzzy matching
+    find_nearest = None if part_number_input.strip() else functools.partial(
+        nearest_all_brands, brands, mm=mm, inches=inches, awg=awg, material=material)
 else:
-    copper_input = st.sidebar.text_input('Enter Copper Wire Value')
-    medium_input = st.sidebar.text_input('Enter Medium Wire Value')
-    hard_input = st.sidebar.text_input('Enter Hard Wire Value')
+    # Select the appropriate DataFrame and schema based on the user's choice
+    brand = brands[sheet_selection]
+    schema = brand.schema
+    part_number_column = schema.part_number_column
 
-# Function to convert input to float
-def to_float(value):
-    try:
-        return float(value.strip())
-    except ValueError:
-        return None
-
-# Function to convert input to int
-def to_int(value):
-    try:
-        return int(value.strip())
-    except ValueError:
-        return None
-
-# Convert inputs to appropriate types if they are provided
-if sheet_selection != 'EREM':
-    if sheet_selection != 'Swanstrom':
-        mm_value = to_float(mm_input) if mm_input else None
-    awg_value = to_int(awg_input) if awg_input else None
-    inches_value = to_float(inches_input) if inches_input else None
-else:
-    copper_value = to_float(copper_input) if copper_input else None
-    medium_value = to_float(medium_input) if medium_input else None
-    hard_value = to_float(hard_input) if hard_input else None
-
-# Initialize filtered DataFrame as the full DataFrame
-filtered_df = df.copy()
-
-# Apply filters only if user has entered values
-if sheet_selection == 'Excelta':
-    if selected_head_shape != 'None':
-        filtered_df = filtered_df[filtered_df['Size'] == selected_head_shape]
-    if selected_type_of_cut != 'None':
-        filtered_df = filtered_df[filtered_df['Cut'] == selected_type_of_cut]
-    if selected_material_strength != 'None':
-        filtered_df = filtered_df[filtered_df['Wire'] == selected_material_strength]
-elif sheet_selection == 'ideal-tek':
-    if selected_cutter_hardness != 'None':
-        filtered_df = filtered_df[filtered_df['Type'] == selected_cutter_hardness]
-    if selected_head_shape != 'None':
-        filtered_df = filtered_df[filtered_df['Head_Shape'] == selected_head_shape]
-    if selected_head_size != 'None':
-        filtered_df = filtered_df[filtered_df['Head_Size'] == selected_head_size]
-    if selected_type_of_cut != 'None':
-        filtered_df = filtered_df[filtered_df['Cutting_Edge'] == selected_type_of_cut]
-elif sheet_selection == 'Swanstrom':
-    if selected_type_of_cut != 'None':
-        filtered_df = filtered_df[filtered_df['Cut'] == selected_type_of_cut]
-    if selected_material_strength != 'None':
-        filtered_df = filtered_df[filtered_df['Type_of_Cut'] == selected_material_strength]
-elif sheet_selection == 'EREM':
-    if selected_series_of_cutter != 'None':
-        filtered_df = filtered_df[filtered_df['Series_of_Cutter'] == selected_series_of_cutter]
-    if selected_type_of_cut != 'None':
-        filtered_df = filtered_df[filtered_df['Cut_Type'] == selected_type_of_cut]
-
-if part_number_input:
-    filtered_df = filtered_df[filtered_df[part_number_column] == part_number_input]
-
-if sheet_selection != 'EREM':
-    if sheet_selection != 'Swanstrom':
-        if mm_value is not None:
-            if sheet_selection == 'Excelta':
-                filtered_df = filtered_df[(filtered_df['Millimeter_Low'] <= mm_value) & (filtered_df['Millimeter_High'] >= mm_value)]
-            elif sheet_selection == 'ideal-tek':
-                filtered_df = filtered_df[(filtered_df['Lowest_Cutting_Capacity_Millimeter'] <= mm_value) & (filtered_df['Highest_Cutting_Capacity__Millimeter'] >= mm_value)]
-    if inches_value is not None:
-        if sheet_selection == 'Excelta':
-            filtered_df = filtered_df[(filtered_df['Inches_Low'] <= inches_value) & (filtered_df['Inches_High'] >= inches_value)]
-        elif sheet_selection == 'ideal-tek':
-            filtered_df = filtered_df[(filtered_df['Head_Width__inches'] <= inches_value) & (filtered_df['Head_Width__inches'] >= inches_value)]
-        elif sheet_selection == 'Swanstrom':
-            filtered_df = filtered_df[(filtered_df['Lowest_Cutting_Capacity_Inches'] <= inches_value) & (filtered_df['Highest_Cutting_Capacity_Inches'] >= inches_value)]
-if sheet_selection == 'EREM':
-    if copper_value is not None:
-        filtered_df = filtered_df[(filtered_df['Cutting_Capacity_Copper_Low'] <= copper_value) & (filtered_df['Cutting_Capacity_Copper_High'] >= copper_value)]
-    if medium_value is not None:
-        filtered_df = filtered_df[(filtered_df['Cutting_Capacity_Medium_Wire_Low'] <= medium_value) & (filtered_df['Cutting_Capacity_Medium_Wire_High'] >= medium_value)]
-    if hard_value is not None:
-        filtered_df = filtered_df[(filtered_df['Cutting_Capacity_Hard_Wire_Low'] <= hard_value) & (filtered_df['Cutting_Capacity_Hard_Wire_High'] >= hard_value)]
-
-if sheet_selection != 'EREM' and awg_value is not None:
-    if sheet_selection == 'Excelta':
-        filtered_df = filtered_df[(filtered_df['AWG_Low'] <= awg_value) & (filtered_df['AWG_High'] >= awg_value)]
-    elif sheet_selection == 'ideal-tek':
-        filtered_df = filtered_df[(filtered_df['Lowest_AWG'] <= awg_value) & (filtered_df['Highest_AWG'] >= awg_value)]
-    elif sheet_selection == 'Swanstrom':
-        filtered_df = filtered_df[(filtered_df['AWG_Low'] <= awg_value) & (filtered_df['AWG_High'] >= awg_value)]
+    # Get unique values for dropdowns based on selected sheet
+    st.sidebar.subheader('Filter by Attributes')
+    selected_attributes = {}
+    for attribute in schema.attributes:
+        options = ['None'] + brand.attributes[attribute.column].options
+        selected_attributes[attribute.column] = st.sidebar.selectbox(attribute.label, options, index=0)
+
+    # Option to enter part number directly
+    st.sidebar.subheader('Direct Part Search')
+    part_number_input = st.sidebar.text_input('Enter Part Number (if known)')
+
+    # Show appropriate dimension filters based on sheet selection
+    st.sidebar.subheader('Dimension Filters')
+    range_values = {range_filter.key: numeric_input(st.sidebar, range_filter.label, range_filter.value_type,
+                                                    sheet_selection)
+                    for range_filter in schema.ranges}
+
+    # Every filter is answered by a prebuilt index as a set of row ids; the sets are
+    # intersected and the frame is sliced once at the end instead of once per filter.
+    # Each filter's row ids are cached on their own, so changing one control only
+    # recomputes that filter (see query.predicate_cache)
+    selected_attributes = {column: selected for column, selected in selected_attributes.items() if selected != 'None'}
+    filtered_df = query_brand(
+        brands,
+        sheet_selection,
+        attributes=selected_attributes,
+        part_number=part_number_input,
+        dimensions=range_values,
+    )
+    # Closest parts on the dimension filters if nothing matches, keeping the other filters
+    find_nearest = functools.partial(nearest_brand, brands, sheet_selection, attributes=selected_attributes,
+                                     part_number=part_number_input, dimensions=range_values)
+
+# Bulk lookup: a CSV / Excel BOM of wire specs or part numbers, matched in one pass
+st.sidebar.subheader('Batch Lookup')
+bom_file = st.sidebar.file_uploader('Upload BOM (CSV or Excel)', type=['csv', 'xlsx'])
+bom_top = st.sidebar.number_input('Matches per BOM line', min_value=1, value=5)
+
+# Workbook cells the loader could not read (left blank in the results), for whoever maintains the workbook
+diagnostics = brands.diagnostics if sheet_selection == ALL_BRANDS else brands[sheet_selection].diagnostics
+if not diagnostics.empty:
+    with st.sidebar.expander(f'Unreadable Workbook Cells ({len(diagnostics)})'):
+        st.dataframe(diagnostics, hide_index=True)
 
 # Display the filtered DataFrame with display-friendly column names
 st.subheader('Filtered Parts Information')
-display_column_mapping = get_display_column_mapping(filtered_df)
-filtered_df_display = filtered_df.rename(columns=display_column_mapping)
-
-# Apply some styling to the DataFrame
-styled_df = filtered_df_display.style.set_properties(**{'text-align': 'left'}).set_table_styles([dict(selector='th', props=[('text-align', 'left')])])
-
-# Apply formatting to remove extra zeros
-styled_df = styled_df.format(precision=3, na_rep='')
-
-st.dataframe(styled_df, width=2000)
+show_table(filtered_df, 'results')
 
 # Ensure there are rows in the filtered DataFrame before proceeding
 if not filtered_df.empty:
@@ -309,15 +240,63 @@ if not filtered_df.empty:
     st.subheader(f'Selected Part Number: {selected_part}')
 
     part_info = filtered_df[filtered_df[part_number_column] == selected_part]
-    part_info_display = part_info.rename(columns=display_column_mapping)
     st.subheader('Details for Selected Part')
-    styled_part_info = part_info_display.style.set_properties(**{'text-align': 'left'}).set_table_styles([dict(selector='th', props=[('text-align', 'left')])])
-
-    # Apply formatting to remove extra zeros
-    styled_part_info = styled_part_info.format(precision=3, na_rep='')
-
-    st.dataframe(styled_part_info, width=2000)
+    show_table(part_info, 'part_info')
+
+    # Closest parts other brands sell for the same wire, from the precomputed equivalence graph
+    selected_brand = part_info['Brand'].iloc[0] if sheet_selection == ALL_BRANDS else sheet_selection
+    selected_rows = brands.parts.matching_rows(str(selected_part), selected_brand)
+    if len(selected_rows):
+        equivalents = brands.parts.equivalents(selected_brand, int(selected_rows[0]))
+        if not equivalents.empty:
+            st.subheader('Equivalent Parts in Other Brands')
+            show_table(equivalents, 'equivalents')
 else:
     st.write('No parts match the selected criteria.')
+    nearest_df = find_nearest() if find_nearest else None
+    if nearest_df is not None and not nearest_df.empty:
+        st.subheader('Nearest Parts')
+        st.caption('Closest capacity ranges to the values entered. Off By is how far each value lies outside the '
+                   "part's range, in the filter's unit; Distance combines them relative to each filter's span.")
+        show_table(nearest_df, 'nearest')
+
+if bom_file is not None:
+    st.subheader('Batch Lookup Results')
+    try:
+        with metrics.stage('app.match_bom'):
+            bom_results = match_uploaded_bom(bom_file.getvalue(), bom_file.name, int(bom_top), brands.version, brands)
+    except ValueError as e:
+        st.error(f'Could not match {bom_file.name}: {e}')
+    else:
+        matched_lines = bom_results.loc[bom_results['Match'] != 'none', 'Line'].nunique()
+        st.write(f"{matched_lines} of {bom_results['Line'].nunique()} BOM lines matched.")
+        show_table(bom_results, 'bom_results')
+
+        # Files are generated only when a download is clicked
+        def bom_csv():
+            out = io.StringIO()
+            write_csv(bom_results, out)
+            return out.getvalue()
+
+        def bom_excel():
+            out = io.BytesIO()
+            write_excel(bom_results, out)
+            return out.getvalue()
+
+        base_name = bom_file.name.rsplit('.', 1)[0]
+        st.download_button('Download CSV', bom_csv, file_name=f'{base_name}_matches.csv', mime='text/csv')
+        st.download_button('Download Excel', bom_excel, file_name=f'{base_name}_matches.xlsx',
+                           mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+# Hidden admin panel: with instrumentation on, open the app with ?admin=1 to see where this rerun's time went
+run = metrics.end_run()
+if run is not None and st.query_params.get('admin') == '1':
+    with st.sidebar.expander('Admin: Rerun Timings', expanded=True):
+        st.caption(f'Rerun took {run.seconds * 1000:.1f} ms (stages nested by indent)')
+        st.dataframe([{'Stage': '\u2003' * s['depth'] + s['stage'], 'ms': round(s['seconds'] * 1000, 2),
+                       'Net Allocated KiB': None if s['allocated_bytes'] is None else round(s['allocated_bytes'] / 1024)}
+                      for s in run.stages], hide_index=True)
+        st.dataframe([{'Cache': name, **stats} for name, stats in metrics.cache_stats().items()], hide_index=True)
+        st.download_button('Prometheus Metrics', metrics.prometheus_text(), file_name='metrics.txt', mime='text/plain')
 
 # To run the app, save this script and run `streamlit run script_name.py` in the terminal
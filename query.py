@@ -0,0 +1,202 @@
+import numpy as np
+
+import metrics
+from cache import LRUCache
+from crossbrand import search_all_brands
+from indexes import intersect, nearest
+from units import MM_PER_INCH
+
+# The filter engine behind the Streamlit app, the HTTP API and batch lookups.
+# Everything here works on a loaded Catalog (see catalog.load_catalog) and has
+# no UI dependencies.
+
+# Brand name that searches every catalog at once
+ALL_BRANDS = 'All Brands'
+
+# Parts suggested when no part matches the range filters exactly
+NEAREST_PARTS = 10
+
+# Row ids of recent brand queries, shared by every session in the process
+ROW_ID_CACHE_SIZE = 256
+row_id_cache = LRUCache(ROW_ID_CACHE_SIZE)
+metrics.register_cache('row_ids', row_id_cache.stats)
+
+# Row ids of single predicates (one range filter value, one part number), shared
+# by every session. When one sidebar control changes, only its predicate is
+# computed; the others come from here and are re-intersected. Attribute lookups
+# are not cached: their row ids are stored in the index already.
+PREDICATE_CACHE_SIZE = 1024
+predicate_cache = LRUCache(PREDICATE_CACHE_SIZE)
+metrics.register_cache('predicates', predicate_cache.stats)
+
+
+# Convert typed text to the filter's type (float or int); None if it doesn't parse
+def parse_value(value, value_type):
+    try:
+        return value_type(value.strip())
+    except ValueError:
+        return None
+
+
+def _brand(catalog, brand_name):
+    try:
+        return catalog[brand_name]
+    except KeyError:
+        raise ValueError(f'unknown brand {brand_name!r}; expected one of {list(catalog)}') from None
+
+
+# Filters in a canonical order, without the ones that are not set, so that the
+# same query always gives the same cache key
+def _query_key(brand_name, attributes, part_number, dimensions):
+    return (
+        brand_name,
+        tuple(sorted((column, value) for column, value in (attributes or {}).items() if value is not None)),
+        ' '.join(part_number.split()) if part_number else None,
+        tuple(sorted((key, value) for key, value in (dimensions or {}).items() if value is not None)),
+    )
+
+
+# Sorted row ids of one brand matching every given filter, or None when no filter
+# is given. attributes maps attribute columns (e.g. 'Cut') to the wanted value and
+# dimensions maps range filter keys (e.g. 'mm', 'awg', 'copper') to a number.
+# Results are memoized per catalog version in row_id_cache; the returned array is
+# shared and read-only.
+def brand_row_ids(catalog, brand_name, attributes=None, part_number=None, dimensions=None):
+    key = _query_key(brand_name, attributes, part_number, dimensions)
+
+    def compute():
+        with metrics.stage('query.row_ids'):
+            return _find_row_ids(catalog, brand_name, attributes, part_number, dimensions)
+
+    return row_id_cache.get_or_compute(catalog.version, key, compute)
+
+
+def _find_row_ids(catalog, brand_name, attributes, part_number, dimensions):
+    brand = _brand(catalog, brand_name)
+    row_ids = []
+    for column, value in (attributes or {}).items():
+        if column not in brand.attributes:
+            raise ValueError(f'{brand_name} has no attribute {column!r}; expected one of {list(brand.attributes)}')
+        if value is not None:
+            row_ids.append(brand.attributes[column].lookup(value))
+
+    if part_number:
+        part_number = ' '.join(part_number.split())
+        row_ids.append(_predicate(catalog, (brand_name, 'part_number', part_number),
+                                  lambda: catalog.parts.matching_rows(part_number, brand_name)))
+
+    for key, value in (dimensions or {}).items():
+        if key not in brand.ranges:
+            raise ValueError(f'{brand_name} has no dimension {key!r}; expected one of {list(brand.ranges)}')
+        if value is not None:
+            row_ids.append(_predicate(catalog, (brand_name, 'range', key, value),
+                                      lambda: brand.ranges[key].query(value)))
+
+    if not row_ids:
+        return None
+    row_ids = intersect(row_ids)
+    if row_ids.base is not None:
+        row_ids = row_ids.copy()
+    row_ids.flags.writeable = False
+    return row_ids
+
+
+# Row ids of one predicate from predicate_cache, computed on a miss. The shared
+# array is made read-only.
+def _predicate(catalog, key, compute):
+    def compute_shared():
+        row_ids = compute()
+        row_ids.flags.writeable = False
+        return row_ids
+
+    return predicate_cache.get_or_compute(catalog.version, key, compute_shared)
+
+
+# Rows of one brand's sheet matching every given filter. The filters only ever
+# narrow a set of row ids; the sheet is sliced once, by a single take of the
+# final ids. With no filter the sheet itself is returned as a shallow copy:
+# pandas copy-on-write copies its data only if the caller modifies it.
+def query_brand(catalog, brand_name, attributes=None, part_number=None, dimensions=None):
+    with metrics.stage('query.brand'):
+        df = _brand(catalog, brand_name).df
+        row_ids = brand_row_ids(catalog, brand_name, attributes, part_number, dimensions)
+        return df.copy(deep=False) if row_ids is None else df.take(row_ids)
+
+
+# Canonical records from every brand matching the wire filters, best fit first.
+# With a part number, only its hits (best match first) that also fit are kept.
+def query_all_brands(catalog, mm=None, inches=None, awg=None, material=None, part_number=None):
+    with metrics.stage('query.all_brands'):
+        results = search_all_brands(catalog, mm=mm, inches=inches, awg=awg, material=material)
+        if part_number:
+            hits = catalog.parts.search(part_number)[['Brand', 'Part_Number', 'Match']]
+            results = hits.merge(results, on=['Brand', 'Part_Number']).drop_duplicates(['Brand', 'Part_Number'])
+        return results
+
+
+# Scale of a dimension for nearest(): the widest finite span of its indexes, 1.0 when
+# that is empty or a single point
+def _scale(bounds):
+    return max((high - low for low, high in bounds if high - low > 0), default=1.0)
+
+
+# Gaps as rounded 'Off_By_<key>' columns in front of the Distance column
+def _with_distances(results, distances, gaps):
+    columns = {'Distance': np.round(distances, 3)}
+    columns.update((f'Off_By_{key}', np.round(gap, 4)) for key, gap in gaps.items())
+    for position, (column, values) in enumerate(columns.items()):
+        results.insert(position, column, values)
+    return results
+
+
+# The k parts of one brand whose ranges come closest to the given dimensions, for
+# when query_brand finds nothing. Attribute and part number filters still apply
+# exactly. Distance combines the gaps to every value, each relative to the span
+# of its filter in the sheet (0 would be a match); Off_By_<key> is the gap in the
+# filter's own unit. Empty when no dimension is given.
+def nearest_brand(catalog, brand_name, attributes=None, part_number=None, dimensions=None, k=NEAREST_PARTS):
+    brand = _brand(catalog, brand_name)
+    dimensions = {key: value for key, value in (dimensions or {}).items() if value is not None}
+    for key in dimensions:
+        if key not in brand.ranges:
+            raise ValueError(f'{brand_name} has no dimension {key!r}; expected one of {list(brand.ranges)}')
+    if not dimensions:
+        return brand.df.iloc[:0]
+
+    with metrics.stage('query.nearest'):
+        allowed = brand_row_ids(catalog, brand_name, attributes, part_number)
+        targets = [(brand.ranges[key], value, _scale([brand.ranges[key].bounds()]))
+                   for key, value in dimensions.items()]
+        ids, distances, gaps = nearest(targets, k, allowed)
+        return _with_distances(brand.df.take(ids), distances, dict(zip(dimensions, gaps)))
+
+
+# The k canonical records from every brand whose capacity comes closest to the
+# wire, for when query_all_brands finds nothing; the material still has to fit.
+# Distance weighs diameter and gauge gaps relative to their span across all
+# brands; Off_By_mm / Off_By_inches / Off_By_awg are the gaps in their own unit.
+def nearest_all_brands(catalog, mm=None, inches=None, awg=None, material=None, k=NEAREST_PARTS):
+    wanted = {key: value for key, value in [('mm', mm), ('inches', inches), ('awg', awg)] if value is not None}
+    records = catalog.records
+    if not wanted:
+        return records.table.iloc[:0]
+
+    with metrics.stage('query.nearest'):
+        capacities = [brand.capacity for brand in catalog.values()]
+        mm_scale = _scale([capacity.mm.bounds() for capacity in capacities])
+        awg_scale = _scale([capacity.awg.bounds() for capacity in capacities])
+        found_ids, found_distances, found_gaps = [], [], []
+        for offset, capacity in zip(records.offsets, capacities):
+            targets = {'mm': (capacity.mm, mm, mm_scale), 'awg': (capacity.awg, awg, awg_scale),
+                       'inches': (capacity.mm, None if inches is None else inches * MM_PER_INCH, mm_scale)}
+            ids, distances, gaps = nearest([targets[key] for key in wanted], k, capacity.query(material=material))
+            found_ids.append(ids + offset)
+            found_distances.append(distances)
+            found_gaps.append(gaps)
+
+        ids, distances, gaps = np.concatenate(found_ids), np.concatenate(found_distances), np.hstack(found_gaps)
+        order = np.lexsort((records.part_rank[ids], records.brand_of(ids), distances))[:k]
+        gaps = dict(zip(wanted, gaps[:, order]))
+        if 'inches' in gaps:
+            gaps['inches'] = gaps['inches'] / MM_PER_INCH
+        return _with_distances(records.table.take(ids[order]).reset_index(drop=True), distances[order], gaps)
@@ -0,0 +1,161 @@
+from collections import namedtuple
+
+from units import AWG, INCHES, MM
+
+# Declarative description of each brand sheet. Everything brand-specific that the
+# loader and the filters need lives here, so adding a brand (or a column to an
+# existing one) is a registry entry rather than another if/elif branch.
+
+# A numeric column stored with unit text in the workbook, e.g. '0.20mm' or '32AWG'.
+# unit is what the column holds (MM, INCHES or AWG); cells written in another
+# unit are converted to it (see units.py). Columns are kept as narrow as their
+# values allow (float32, int16); unreadable cells are left missing, and an
+# integer column with missing cells gets the nullable dtype of its width (Int16).
+UnitColumn = namedtuple('UnitColumn', ['column', 'unit', 'dtype'])
+
+# A sidebar selectbox filtering one categorical column by equality
+AttributeFilter = namedtuple('AttributeFilter', ['label', 'column'])
+
+# A sidebar text input matching rows whose [low, high] range contains the value.
+# value_type is the parser for the typed text (float or int).
+RangeFilter = namedtuple('RangeFilter', ['key', 'label', 'low', 'high', 'value_type'])
+
+# Where a brand keeps its wire cutting capacity, for cross-brand search: the range
+# filter holding the wire diameter and its unit (MM or INCHES), the range filter
+# holding the AWG span (None when the sheet has none) and, for sheets that give
+# one range per wire material in separate columns, which material it is for.
+Capacity = namedtuple('Capacity', ['diameter', 'unit', 'awg', 'material'])
+
+BrandSchema = namedtuple('BrandSchema', ['sheet_name', 'part_number_column', 'title_case_columns',
+                                         'unit_columns', 'attributes', 'ranges',
+                                         'cut_column', 'capacities', 'material_column', 'materials'])
+
+# Low-cardinality text columns of a sheet (the filterable attributes, the cut
+# and the material), stored as categoricals: small integer codes plus one copy
+# of each distinct value
+def categorical_columns(schema):
+    columns = [a.column for a in schema.attributes] + [schema.cut_column, schema.material_column]
+    return list(dict.fromkeys(c for c in columns if c))
+
+
+# Canonical wire materials used by cross-brand search
+MATERIALS = ['Soft', 'Medium', 'Hard']
+
+BRANDS = {
+    'Excelta': BrandSchema(
+        sheet_name='Excelta',
+        part_number_column='Part_#',
+        title_case_columns=['Size'],
+        unit_columns=[
+            UnitColumn('Millimeter_Low', MM, 'float32'),
+            UnitColumn('Millimeter_High', MM, 'float32'),
+            UnitColumn('Inches_Low', INCHES, 'float32'),
+            UnitColumn('Inches_High', INCHES, 'float32'),
+            UnitColumn('AWG_High', AWG, 'int16'),
+            UnitColumn('AWG_Low', AWG, 'int16'),
+        ],
+        attributes=[
+            AttributeFilter('Select Head Shape', 'Size'),
+            AttributeFilter('Select Type of Cut', 'Cut'),
+            AttributeFilter('Select Material Strength', 'Wire'),
+        ],
+        ranges=[
+            RangeFilter('mm', 'Enter Millimeter Value', 'Millimeter_Low', 'Millimeter_High', float),
+            RangeFilter('inches', 'Enter Inches Value', 'Inches_Low', 'Inches_High', float),
+            RangeFilter('awg', 'Enter AWG Value', 'AWG_Low', 'AWG_High', int),
+        ],
+        cut_column='Cut',
+        capacities=[Capacity('mm', MM, 'awg', None)],
+        material_column='Wire',
+        materials={'Soft': 'Soft', 'Hard': 'Hard'},
+    ),
+    'ideal-tek': BrandSchema(
+        sheet_name='ideal-tek',
+        part_number_column='Part_Number',
+        title_case_columns=[],
+        unit_columns=[
+            UnitColumn('Head_Width_Millimeter', MM, 'float32'),
+            UnitColumn('Head_Width__inches', INCHES, 'float32'),
+            UnitColumn('Lowest_Cutting_Capacity_Millimeter', MM, 'float32'),
+            UnitColumn('Highest_Cutting_Capacity__Millimeter', MM, 'float32'),
+            UnitColumn('Highest_AWG', AWG, 'Int16'),
+            UnitColumn('Lowest_AWG', AWG, 'Int16'),
+            UnitColumn('OAL_Millimeter', MM, 'float32'),
+            UnitColumn('OAL__inches', INCHES, 'float32'),
+        ],
+        attributes=[
+            AttributeFilter('Select Cutter Hardness', 'Type'),
+            AttributeFilter('Select Head Shape', 'Head_Shape'),
+            AttributeFilter('Select Head Size', 'Head_Size'),
+            AttributeFilter('Select Type of Cut', 'Cutting_Edge'),
+        ],
+        ranges=[
+            RangeFilter('mm', 'Enter Millimeter Value', 'Lowest_Cutting_Capacity_Millimeter',
+                        'Highest_Cutting_Capacity__Millimeter', float),
+            # The sheet has no inch cutting capacity, so inches match the head width exactly
+            RangeFilter('inches', 'Enter Inches Value', 'Head_Width__inches', 'Head_Width__inches', float),
+            RangeFilter('awg', 'Enter AWG Value', 'Lowest_AWG', 'Highest_AWG', int),
+        ],
+        cut_column='Cutting_Edge',
+        capacities=[Capacity('mm', MM, 'awg', None)],
+        material_column=None,
+        materials={},
+    ),
+    'Swanstrom': BrandSchema(
+        sheet_name='Swanstrom',
+        part_number_column='Model_#',
+        title_case_columns=[],
+        unit_columns=[
+            UnitColumn('Lowest_Cutting_Capacity_Inches', INCHES, 'float32'),
+            UnitColumn('Highest_Cutting_Capacity_Inches', INCHES, 'float32'),
+            UnitColumn('AWG_Low', AWG, 'Int16'),
+            UnitColumn('AWG_High', AWG, 'Int16'),
+        ],
+        attributes=[
+            AttributeFilter('Select Type of Cut', 'Cut'),
+            AttributeFilter('Select Material Strength', 'Type_of_Cut'),
+        ],
+        ranges=[
+            RangeFilter('inches', 'Enter Inches Value', 'Lowest_Cutting_Capacity_Inches',
+                        'Highest_Cutting_Capacity_Inches', float),
+            RangeFilter('awg', 'Enter AWG Value', 'AWG_Low', 'AWG_High', int),
+        ],
+        cut_column='Cut',
+        capacities=[Capacity('inches', INCHES, 'awg', None)],
+        material_column='Type_of_Cut',
+        materials={'Soft': 'Soft', 'Medium Hard': 'Medium', 'Hard': 'Hard'},
+    ),
+    'EREM': BrandSchema(
+        sheet_name='EREM',
+        part_number_column='Part_Number',
+        title_case_columns=[],
+        unit_columns=[
+            UnitColumn('Cutting_Capacity_Copper_Low', INCHES, 'float32'),
+            UnitColumn('Cutting_Capacity_Copper_High', INCHES, 'float32'),
+            UnitColumn('Cutting_Capacity_Medium_Wire_Low', INCHES, 'float32'),
+            UnitColumn('Cutting_Capacity_Medium_Wire_High', INCHES, 'float32'),
+            UnitColumn('Cutting_Capacity_Hard_Wire_Low', INCHES, 'float32'),
+            UnitColumn('Cutting_Capacity_Hard_Wire_High', INCHES, 'float32'),
+        ],
+        attributes=[
+            AttributeFilter('Select Series of Cutter', 'Series_of_Cutter'),
+            AttributeFilter('Select Type of Cut', 'Cut_Type'),
+        ],
+        ranges=[
+            RangeFilter('copper', 'Enter Copper Wire Value', 'Cutting_Capacity_Copper_Low',
+                        'Cutting_Capacity_Copper_High', float),
+            RangeFilter('medium', 'Enter Medium Wire Value', 'Cutting_Capacity_Medium_Wire_Low',
+                        'Cutting_Capacity_Medium_Wire_High', float),
+            RangeFilter('hard', 'Enter Hard Wire Value', 'Cutting_Capacity_Hard_Wire_Low',
+                        'Cutting_Capacity_Hard_Wire_High', float),
+        ],
+        cut_column='Cut_Type',
+        capacities=[
+            Capacity('copper', INCHES, None, 'Soft'),
+            Capacity('medium', INCHES, None, 'Medium'),
+            Capacity('hard', INCHES, None, 'Hard'),
+        ],
+        material_column=None,
+        materials={},
+    ),
+}
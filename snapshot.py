@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Columnar snapshot of the normalized catalog.
+#
+# Layout, next to the workbook:
+#   <workbook>.snapshot/manifest.json                 which version is current + column metadata
+#   <workbook>.snapshot/sheets/<sheet>-<key>/N.npy    one file per column (plus N.mask.npy for nulls,
+#                                                     N.categories.npy for categoricals)
+#   <workbook>.snapshot/sheets/<sheet>-<key>/index.N.npy  arrays of the sheet's prebuilt indexes
+#   <workbook>.snapshot/<version>/equivalents.npz     cross-brand equivalence graph
+#
+# Sheets are stored under their own content key rather than inside the version,
+# so a new version where only one sheet changed writes that sheet alone and
+# points the manifest at the existing folders of the others.
+#
+# Column and index files are plain .npy so numeric ones can be memory-mapped
+# straight into the frames and indexes: every process that opens the same
+# snapshot shares one copy of them through the page cache. The manifest is
+# written last with an atomic rename, so a reader always sees either the
+# previous complete snapshot or the new one, and publishing a new version is a
+# single swap. The manifest records the source key, so a snapshot built from
+# another workbook (or by an older normalization schema) is treated as stale.
+FORMAT_VERSION = 7
+MANIFEST = 'manifest.json'
+SHEETS = 'sheets'
+
+
+# Default snapshot location for a workbook
+def snapshot_dir_for(file_path):
+    return os.path.splitext(os.path.abspath(file_path))[0] + '.snapshot'
+
+
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+# Folder holding the files of one snapshot version
+def version_dir(snapshot_dir, source_key):
+    return os.path.join(snapshot_dir, source_key[:16])
+
+
+# Split a column into (kind, {suffix: ndarray}) for storage
+def _encode_column(series):
+    dtype = series.dtype
+    if isinstance(series.array, (pd.arrays.IntegerArray, pd.arrays.BooleanArray)):
+        # Nullable integer / boolean (e.g. Int64): raw values plus null mask
+        return 'masked', str(dtype), {'': series.array._data, '.mask': series.array._mask}
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Codes plus the category values; missing values are code -1
+        categories = dtype.categories
+        if not all(isinstance(v, str) for v in categories):
+            raise ValueError(f'column {series.name!r} has non-string categories')
+        return 'category', str(series.cat.codes.dtype), {'': series.cat.codes.to_numpy(),
+                                                          '.categories': np.array(categories, dtype=str)}
+    if dtype.kind in 'iufb' and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        return 'numeric', str(dtype), {'': series.to_numpy()}
+    if dtype == object or pd.api.types.is_string_dtype(dtype):
+        mask = series.isna().to_numpy()
+        values = series.to_numpy(dtype=object, na_value='')
+        if not all(isinstance(v, str) for v in values):
+            raise ValueError(f'column {series.name!r} mixes strings and other values')
+        return 'str', 'str', {'': np.array(values, dtype=str), '.mask': mask}
+    raise ValueError(f'column {series.name!r} has unsupported dtype {dtype}')
+
+
+def _decode_column(kind, dtype, folder, stem):
+    values = np.load(os.path.join(folder, stem + '.npy'), mmap_mode='r' if kind != 'str' else None)
+    if kind == 'numeric':
+        return values
+    if kind == 'category':
+        categories = np.load(os.path.join(folder, stem + '.categories.npy'))
+        return pd.Categorical.from_codes(np.asarray(values), pd.Index(categories.astype(object), dtype='str'))
+    mask = np.load(os.path.join(folder, stem + '.mask.npy'))
+    if kind == 'masked':
+        array_type = pd.arrays.BooleanArray if dtype == 'boolean' else pd.arrays.IntegerArray
+        return array_type(np.asarray(values), mask)
+    column = values.astype(object)
+    column[mask] = np.nan
+    return column
+
+
+# Write one sheet (and its index arrays) into folder; returns its manifest entry
+def _write_sheet(folder, df, indexes):
+    os.makedirs(folder)
+    columns = []
+    for i, col in enumerate(df.columns):
+        kind, dtype, arrays = _encode_column(df[col])
+        for suffix, array in arrays.items():
+            np.save(os.path.join(folder, f'{i}{suffix}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+        columns.append({'name': col, 'kind': kind, 'dtype': dtype})
+    for i, array in enumerate(indexes.values()):
+        np.save(os.path.join(folder, f'index.{i}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+    return {'rows': len(df), 'columns': columns, 'indexes': list(indexes)}
+
+
+# Write {sheet_name: DataFrame} as the current snapshot. source_key identifies
+# what the frames were built from (workbook contents + normalization schema);
+# sheet_keys optionally gives the same per sheet, and a sheet whose key matches
+# the current snapshot is not written again. indexes optionally holds
+# {sheet_name: {name: ndarray}} of prebuilt indexes, and diagnostics
+# {sheet_name: [record, ...]} JSON records kept in the sheet's manifest entry.
+# before_publish(folder) may add files to the version folder before it becomes current.
+def write_snapshot(snapshot_dir, source_key, sheets, indexes=None, before_publish=None, sheet_keys=None,
+                   diagnostics=None):
+    os.makedirs(os.path.join(snapshot_dir, SHEETS), exist_ok=True)
+    version = os.path.basename(version_dir(snapshot_dir, source_key))
+    previous = read_manifest(snapshot_dir) or {}
+    current = previous.get('sheets', {})
+    staging = tempfile.mkdtemp(prefix='.build-', dir=snapshot_dir)
+    try:
+        meta = {}
+        for name, df in sheets.items():
+            key = (sheet_keys or {}).get(name, source_key)
+            stored = current.get(name)
+            if stored is not None and stored.get('key') == key and os.path.isdir(
+                    os.path.join(snapshot_dir, stored['folder'])):
+                meta[name] = stored
+                continue
+            folder = f'{SHEETS}/{_slug(name)}-{key[:16]}'
+            written = _write_sheet(os.path.join(staging, _slug(name)), df, (indexes or {}).get(name, {}))
+            target = os.path.join(snapshot_dir, folder)
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(os.path.join(staging, _slug(name)), target)
+            meta[name] = {'folder': folder, 'key': key, **written, 'diagnostics': (diagnostics or {}).get(name, [])}
+        target = os.path.join(snapshot_dir, version)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+        if before_publish is not None:
+            before_publish(target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    manifest = {'format': FORMAT_VERSION, 'source_key': source_key, 'version': version, 'sheets': meta}
+    fd, tmp = tempfile.mkstemp(prefix='.manifest-', dir=snapshot_dir)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(snapshot_dir, MANIFEST))
+
+    # Drop superseded versions and sheets; readers that already opened them keep
+    # their mmaps. The version just replaced is kept too, since readers open its
+    # sheets on first use (see catalog.Catalog).
+    for entry in os.listdir(snapshot_dir):
+        if entry not in (version, previous.get('version'), MANIFEST, SHEETS) and not entry.startswith('.'):
+            shutil.rmtree(os.path.join(snapshot_dir, entry), ignore_errors=True)
+    in_use = {entry['folder'] for entry in list(meta.values()) + list(current.values())}
+    for entry in os.listdir(os.path.join(snapshot_dir, SHEETS)):
+        if f'{SHEETS}/{entry}' not in in_use:
+            shutil.rmtree(os.path.join(snapshot_dir, SHEETS, entry), ignore_errors=True)
+    return manifest
+
+
+def read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+# (DataFrame, {name: ndarray}) of one sheet described by its manifest entry
+def open_sheet(snapshot_dir, meta):
+    folder = os.path.join(snapshot_dir, meta['folder'])
+    data = {c['name']: _decode_column(c['kind'], c['dtype'], folder, str(i)) for i, c in enumerate(meta['columns'])}
+    df = pd.DataFrame(data, columns=[c['name'] for c in meta['columns']], copy=False)
+    indexes = {index_name: np.load(os.path.join(folder, f'index.{i}.npy'), mmap_mode='r')
+               for i, index_name in enumerate(meta.get('indexes', []))}
+    return df, indexes
+
+
+# ({sheet_name: DataFrame}, {sheet_name: {name: ndarray}}, {sheet_name:
+# manifest entry}) of the sheets in the current snapshot whose key matches
+# sheet_keys ({sheet_name: key}), whatever version they belong to; sheets that
+# are missing or stale are left out
+def open_sheets(snapshot_dir, sheet_keys):
+    manifest = read_manifest(snapshot_dir)
+    sheets, indexes, entries = {}, {}, {}
+    for name, key in sheet_keys.items():
+        meta = (manifest or {}).get('sheets', {}).get(name)
+        if meta is None or meta.get('key') != key:
+            continue
+        try:
+            sheets[name], indexes[name] = open_sheet(snapshot_dir, meta)
+        except (OSError, KeyError, ValueError):
+            continue
+        entries[name] = meta
+    return sheets, indexes, entries
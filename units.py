@@ -0,0 +1,202 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pandas without pyarrow: Series.str.extract, one regex match per cell
+    pa = pc = None
+
+# Parser for the dimension cells of the brand sheets. Suppliers type them as
+# text with whatever unit comes to mind ('0.20mm', '0.8 mm', '1/32"', '.031in',
+# '1-1/2 in', '24AWG', 'AWG 24', '22-26 AWG'), so instead of stripping one fixed
+# suffix per column, every cell of a column is matched against one compiled
+# pattern in a single vectorized pass (pyarrow's regex kernel when available)
+# and converted to the unit the column is stored in. Cells that cannot be read
+# become missing values and are reported, instead of aborting the load.
+
+MM_PER_INCH = 25.4
+
+# Units a column can be stored in
+MM = 'mm'
+INCHES = 'in'
+AWG = 'awg'
+
+# Unit spellings (lower case) -> (unit, factor to that unit)
+UNIT_ALIASES = {
+    'mm': (MM, 1.0),
+    'millimeter': (MM, 1.0),
+    'millimeters': (MM, 1.0),
+    'millimetre': (MM, 1.0),
+    'millimetres': (MM, 1.0),
+    'cm': (MM, 10.0),
+    'in': (INCHES, 1.0),
+    'in.': (INCHES, 1.0),
+    'inch': (INCHES, 1.0),
+    'inches': (INCHES, 1.0),
+    '"': (INCHES, 1.0),
+    "''": (INCHES, 1.0),
+    '”': (INCHES, 1.0),  # typographic double quote
+    '″': (INCHES, 1.0),  # double prime
+    'awg': (AWG, 1.0),
+    # 'AWH' is a typo that appears in the Swanstrom sheet
+    'awh': (AWG, 1.0),
+    'ga': (AWG, 1.0),
+    'gauge': (AWG, 1.0),
+}
+_ALIASES = list(UNIT_ALIASES)
+_ALIAS_UNITS = np.array([unit for unit, _ in UNIT_ALIASES.values()])
+_ALIAS_FACTORS = np.array([factor for _, factor in UNIT_ALIASES.values()])
+
+
+# Significant decimal digits a float32 column holds (FLT_DIG): every value typed with
+# at most this many comes back exactly once widened and rounded to them
+FLOAT32_DIGITS = 6
+
+
+# Values rounded to `digits` significant decimal digits (NaN and inf kept)
+def round_significant(values, digits):
+    values = np.asarray(values, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    scale = 10.0 ** np.where(np.isfinite(magnitude), digits - 1 - magnitude, 0)
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isfinite(values), np.round(values * scale) / scale, values)
+
+
+# The frame with its float32 columns as float64 rounded to FLOAT32_DIGITS, for
+# results leaving the catalog: a stored 0.2 is shown and sent as 0.2, not as the
+# 0.200000003 a plain upcast gives
+def widen_floats(df):
+    narrow = [column for column, dtype in df.dtypes.items() if dtype == np.float32]
+    if not narrow:
+        return df
+    return df.assign(**{column: round_significant(df[column].to_numpy(), FLOAT32_DIGITS) for column in narrow})
+
+
+# American Wire Gauge <-> diameter in mm
+def awg_to_mm(awg):
+    return 0.127 * 92.0 ** ((36 - np.asarray(awg, dtype='float64')) / 39)
+
+
+def mm_to_awg(mm):
+    with np.errstate(divide='ignore'):
+        return 36 - 39 * np.log(np.asarray(mm, dtype='float64') / 0.127) / np.log(92.0)
+
+
+# A number: decimal ('0.20', '.031', '24'), fraction ('1/32') or mixed ('1 1/2', '1-1/2')
+_NUMBER = r'(?:(?:(?P<{0}_whole>\d+)[ -]+)?(?P<{0}_num>\d+)/(?P<{0}_den>\d+)|(?P<{0}_dec>\d+(?:\.\d*)?|\.\d+))'
+_UNIT = '|'.join(re.escape(alias) for alias in sorted(_ALIASES, key=len, reverse=True))
+
+# One value or a range of two, each with an optional unit, or a gauge written
+# before the number ('AWG 24'). Only named groups, as pyarrow's kernel requires.
+PATTERN = (rf'(?i)^\s*(?:(?P<prefix>awg|awh|ga)\s*)?{_NUMBER.format("a")}\s*(?P<a_unit>{_UNIT})?'
+           rf'\s*(?:(?:-|–|to)\s*{_NUMBER.format("b")}\s*(?P<b_unit>{_UNIT})?)?\s*$')
+
+
+_NUMBER_PARTS = ('whole', 'num', 'den', 'dec')
+
+
+# ({group name: ndarray}, matched mask) for a lower-cased text column: number
+# groups as float64 (NaN when absent), unit groups as object arrays of text or None
+def _extract(text):
+    if pc is not None:
+        result = pc.extract_regex(pa.array(text), PATTERN)
+        matched = result.is_valid()
+        groups = {}
+        for i, field in enumerate(result.type):
+            # Groups that did not take part in a match come back as ''
+            values = result.field(i)
+            values = pc.if_else(pc.and_(matched, pc.not_equal(values, '')), values, pa.scalar(None, values.type))
+            if field.name.endswith(_NUMBER_PARTS):
+                values = pc.cast(values, pa.float64())
+            groups[field.name] = values.to_numpy(zero_copy_only=False)
+        return groups, matched.to_numpy(zero_copy_only=False)
+    extracted = text.str.extract(PATTERN)
+    groups = {name: (pd.to_numeric(values).to_numpy(dtype='float64', na_value=np.nan)
+                     if name.endswith(_NUMBER_PARTS) else values.to_numpy(dtype=object, na_value=None))
+              for name, values in extracted.items()}
+    return groups, extracted.notna().any(axis=1).to_numpy()
+
+
+def _number(groups, side):
+    whole, num, den, dec = (groups[f'{side}_{part}'] for part in _NUMBER_PARTS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.nan_to_num(whole) + num / den
+    return np.where(np.isnan(dec), fraction, dec)
+
+
+# (unit, factor) arrays for one side: its own unit, else the other side's, else
+# the gauge prefix, else the column's unit. Spellings are already lower case.
+def _units(own, other, prefix, column_unit):
+    spelled = np.where(pd.notna(own), own, np.where(pd.notna(other), other, prefix))
+    positions = pd.Index(_ALIASES).get_indexer(spelled)
+    units = np.where(positions >= 0, _ALIAS_UNITS[positions], column_unit)
+    factors = np.where(positions >= 0, _ALIAS_FACTORS[positions], 1.0)
+    return units, factors
+
+
+# Values expressed in column_unit. Lengths convert into each other, and gauges
+# convert to lengths; a length cannot be turned into a (discrete) gauge.
+def _convert(number, units, factors, column_unit):
+    value = number * factors
+    if column_unit == AWG:
+        return np.where(units == AWG, value, np.nan)
+    to_mm = {MM: 1.0, INCHES: MM_PER_INCH}
+    scale = to_mm[MM if column_unit == MM else INCHES]
+    return np.select(
+        [units == column_unit, units == MM, units == INCHES, units == AWG],
+        [value, value / scale, value * MM_PER_INCH / scale, awg_to_mm(value) / scale],
+        np.nan)
+
+
+# Parse one column of dimension cells into float64 values in column_unit ('mm',
+# 'in' or 'awg'). bound says which end of a range cell ('22-26 AWG') the column
+# keeps: 'low' for the smaller, 'high' for the larger, None if ranges are not
+# expected. whole requires whole numbers (gauges stored as integers). Returns
+# (values, problems): problems is a Series of messages, indexed like the column,
+# for the cells that were present but could not be read; they are NaN in values.
+def parse_column(column, column_unit, bound=None, whole=False):
+    if pd.api.types.is_numeric_dtype(column):
+        values = column.to_numpy(dtype='float64', na_value=np.nan)
+        fractional = whole & np.isfinite(values) & (values != np.round(values))
+        problems = np.where(fractional, 'not a whole number', None)
+        return np.where(fractional, np.nan, values), _problem_series(problems, column.index)
+
+    # Lower case once for the whole column, so unit spellings need no per-cell work
+    text = column.astype('str').str.lower()
+    present = text.str.strip().fillna('').to_numpy(dtype=object) != ''
+    groups, matched = _extract(text)
+
+    a_units, a_factors = _units(groups['a_unit'], groups['b_unit'], groups['prefix'], column_unit)
+    b_units, b_factors = _units(groups['b_unit'], groups['a_unit'], groups['prefix'], column_unit)
+    a = _convert(_number(groups, 'a'), a_units, a_factors, column_unit)
+    b = _convert(_number(groups, 'b'), b_units, b_factors, column_unit)
+    is_range = ~np.isnan(groups['b_num']) | ~np.isnan(groups['b_dec'])
+
+    if bound == 'low':
+        values = np.where(is_range, np.fmin(a, b), a)
+    elif bound == 'high':
+        values = np.where(is_range, np.fmax(a, b), a)
+    else:
+        values = np.where(is_range, np.nan, a)
+
+    if column_unit == AWG:
+        length_for_gauge = (a_units != AWG) | (is_range & (b_units != AWG))
+    else:
+        length_for_gauge = np.zeros(len(values), dtype=bool)
+    fractional = whole & np.isfinite(values) & (values != np.round(values))
+    problems = np.select(
+        [~present, ~matched, length_for_gauge, is_range & (bound is None), ~np.isfinite(values), fractional],
+        np.array([None, 'unreadable', 'length in a gauge column', 'range in a single-value column', 'unreadable',
+                  'not a whole number'], dtype=object),
+        None)
+    values = np.where(pd.isna(problems), values, np.nan)
+    return values, _problem_series(problems, column.index)
+
+
+def _problem_series(problems, index):
+    found = pd.notna(problems)
+    return pd.Series(problems[found], index=index[found], dtype=object)
@@ -0,0 +1,222 @@
+import hashlib
+import html
+import posixpath
+import re
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+from pandas.io.parsers import TextParser
+
+import metrics
+from cache import LRUCache
+
+# Direct reads of the .xlsx package (a zip of SpreadsheetML parts), for what
+# pandas does not expose: a content fingerprint per sheet, so a workbook where
+# one tab was edited only re-ingests that tab, and a streaming reader that hands
+# a sheet over in bounded chunks of rows.
+#
+# A sheet's cells live in its own part (xl/worksheets/sheetN.xml), but text cells
+# only hold an index into the workbook-wide shared string table, and editing any
+# tab can renumber that table. The fingerprint therefore hashes the sheet's
+# <sheetData> with every shared-string index replaced by the text it points to
+# (and inline strings, which some writers use instead, in the same form):
+# it changes exactly when the sheet's cell values change, not when another tab
+# is edited or the file is re-saved. Cell formatting is not part of it either:
+# <row> and <c> tags are hashed with only their reference and data type, without
+# style, height, span or other layout attributes, and cells or rows that hold
+# nothing (formatting only) are left out. What a sheet part hashes to without its
+# texts is cached by the part's CRC and sizes in the zip directory, so a reload
+# only decompresses and scans the sheets that changed; the texts are looked up
+# again each time, as another tab's edit can renumber the shared strings.
+
+# Rows per chunk of the streaming reader
+CHUNK_ROWS = 10_000
+
+# Sheet structures and shared string tables kept between fingerprints (see
+# _fingerprints): the four brand sheets and the strings of two workbook versions
+STRUCTURE_CACHE_SIZE = 10
+
+# Cell data types of the SpreadsheetML format (openpyxl.cell.cell.TYPE_ERROR and
+# TYPE_NUMERIC), so openpyxl is only imported once a workbook is actually read
+TYPE_ERROR = 'e'
+TYPE_NUMERIC = 'n'
+
+_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_RELATIONSHIPS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+_SHEET_DATA = re.compile(rb'<(?:\w+:)?sheetData\b.*?(?:/>|</(?:\w+:)?sheetData>)', re.S)
+# <row> and <c> tags, and the attributes of theirs that are part of the fingerprint
+_LAYOUT_TAG = re.compile(rb'<((?:\w+:)?(?:row|c))\b([^>]*?)(/?)>')
+_KEPT_ATTRIBUTE = re.compile(rb'\s(?:r|t)="[^"]*"')
+# A <c> or <row> without content, once stripped down to its kept attributes
+_EMPTY_TAG = re.compile(rb'<(?:\w+:)?(?:row|c)\b[^>]*?(?:/>|></(?:\w+:)?(?:row|c)>)')
+# An inline-string cell: t="inlineStr" on the <c> tag, then its <is> text runs
+_INLINE_CELL = re.compile(rb'(<(?:\w+:)?c\b[^>]*?\bt=")inlineStr("[^>]*>)<(?:\w+:)?is>(.*?)</(?:\w+:)?is>', re.S)
+_TEXT_RUN = re.compile(rb'<(?:\w+:)?t\b[^>]*>(.*?)</(?:\w+:)?t>', re.S)
+# A shared-string cell: t="s" on the <c> tag, then its <v> within the same cell
+_SHARED_CELL = re.compile(rb'(<(?:\w+:)?c\b[^>]*?\bt="s"[^>]*(?<!/)>(?:(?!</(?:\w+:)?c>).)*?<(?:\w+:)?v>)'
+                          rb'(-?\d+)(</)', re.S)
+
+# {('sheet', crc, sizes): _sheet_structure(), ('strings', crc, size): _prefixed_strings()}
+structure_cache = LRUCache(STRUCTURE_CACHE_SIZE)
+metrics.register_cache('sheet_structures', structure_cache.stats)
+
+
+# {sheet name: part name inside the zip}
+def _sheet_parts(archive):
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    relationships = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in relationships}
+    parts = {}
+    for sheet in workbook.iter(f'{{{_MAIN}}}sheet'):
+        target = targets[sheet.get(f'{{{_RELATIONSHIPS}}}id')]
+        parts[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else posixpath.normpath(
+            posixpath.join('xl', target))
+    return parts
+
+
+# Shared string table as a list of UTF-8 texts (rich text runs joined)
+def _shared_strings(archive):
+    try:
+        root = ElementTree.fromstring(archive.read('xl/sharedStrings.xml'))
+    except KeyError:
+        return []
+    return [''.join(node.text or '' for node in item.iter(f'{{{_MAIN}}}t')).encode()
+            for item in root.iter(f'{{{_MAIN}}}si')]
+
+
+# {sheet name: sha256 of the sheet's cell values} for the named sheets (all
+# sheets by default). Raises ValueError when the file is not an .xlsx package
+# this can read or lacks one of the sheets.
+def sheet_fingerprints(file_path, sheet_names=None):
+    try:
+        return _fingerprints(file_path, sheet_names)
+    except (zipfile.BadZipFile, KeyError, IndexError, ElementTree.ParseError) as e:
+        raise ValueError(f'cannot fingerprint the sheets of {file_path}: {e!r}')
+
+
+# Shared string table as length-prefixed texts, so no text can imitate the
+# surrounding markup or run into its neighbour once joined
+def _prefixed_strings(archive):
+    return [b'%d:%s' % (len(text), text) for text in _shared_strings(archive)]
+
+
+# (digest, shared string indices, [inline text]) of one sheet part: the sha256 of
+# its <sheetData> without layout, with each string cell's text taken out. The
+# texts go into the fingerprint in cell order: an index >= 0 is into the shared
+# string table, -n is the sheet's own n-th inline string.
+def _sheet_structure(archive, info):
+    xml = archive.read(info)
+    found = _SHEET_DATA.search(xml)
+    cells = found.group(0) if found else b''
+    inline_texts = []
+
+    def strip_layout(match):
+        return b'<%s%s%s>' % (match.group(1), b''.join(_KEPT_ATTRIBUTE.findall(match.group(2))), match.group(3))
+
+    def inline(match):
+        text = b''.join(_TEXT_RUN.findall(match.group(3)))
+        if b'&' in text:
+            text = html.unescape(text.decode()).encode()
+        inline_texts.append(b'%d:%s' % (len(text), text))
+        return b'%ss%s<v>-%d</v>' % (match.group(1), match.group(2), len(inline_texts))
+
+    cells = _LAYOUT_TAG.sub(strip_layout, cells)
+    # Twice: a row whose cells were all empty is empty once they are gone
+    cells = _EMPTY_TAG.sub(b'', _EMPTY_TAG.sub(b'', _INLINE_CELL.sub(inline, cells)))
+    # [markup, cell start, index, '</', markup, ...]: one pass takes the indices out
+    pieces = _SHARED_CELL.split(cells)
+    indices = np.array([int(index) for index in pieces[2::4]], dtype=np.int32)
+    del pieces[2::4]
+    return hashlib.sha256(b''.join(pieces)).digest(), indices, inline_texts
+
+
+def _fingerprints(file_path, sheet_names):
+    with zipfile.ZipFile(file_path) as archive:
+        parts = _sheet_parts(archive)
+        try:
+            table = archive.getinfo('xl/sharedStrings.xml')
+        except KeyError:
+            table = None
+        strings = [] if table is None else structure_cache.get_or_compute(
+            None, ('strings', table.CRC, table.file_size), lambda: _prefixed_strings(archive))
+
+        fingerprints = {}
+        for name in sheet_names or parts:
+            info = archive.getinfo(parts[name])
+            # An unchanged part (same CRC and sizes in the zip directory) is not
+            # even decompressed
+            digest, indices, inline_texts = structure_cache.get_or_compute(
+                None, ('sheet', info.CRC, info.file_size, info.compress_size),
+                lambda: _sheet_structure(archive, info))
+            texts = b''.join([strings[i] if i >= 0 else inline_texts[-i - 1] for i in indices.tolist()])
+            fingerprints[name] = hashlib.sha256(digest + texts).hexdigest()
+    return fingerprints
+
+
+# Open a workbook for streaming: openpyxl's read-only reader, which parses a
+# sheet's XML lazily as its rows are iterated (the same options pd.read_excel uses)
+def open_workbook(file_path):
+    import openpyxl
+
+    return openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+
+
+# Cell value as pd.read_excel converts it: integral numbers as int, errors as NaN
+def _cell_value(cell):
+    if cell.value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+# The rows of a sheet as DataFrames of at most chunk_rows rows, with the first
+# row as the header. Only one chunk of cell values is in memory at a time. Each
+# chunk goes through the parser pd.read_excel uses, so header names, missing
+# values and type inference come out the same; a column may get a different
+# dtype in different chunks (int where one chunk has no gaps, float where it
+# has), which concatenating the chunks and infer_objects() reconciles. Blank
+# rows at the end are dropped, and cells right of the last titled column are
+# ignored. Frames are indexed by row position under the header (0 is the
+# sheet's second row), and at least one (possibly empty) frame is yielded.
+def iter_sheet_chunks(book, sheet_name, chunk_rows=CHUNK_ROWS):
+    sheet = book[sheet_name]
+    sheet.reset_dimensions()
+    rows = sheet.iter_rows()
+    header = [_cell_value(cell) for cell in next(rows, ())]
+    while header and header[-1] == '':
+        header.pop()
+    width = len(header)
+
+    columns, chunk, blank, start = None, [], [], 0
+    for row in rows:
+        values = [_cell_value(cell) for cell in row[:width]]
+        values += [''] * (width - len(values))
+        if all(value == '' for value in values):
+            # Kept only if a non-blank row follows
+            blank.append(values)
+            continue
+        chunk.extend(blank)
+        chunk.append(values)
+        blank = []
+        if len(chunk) >= chunk_rows:
+            if columns is None:
+                df = TextParser([header] + chunk, header=0).read()
+                columns = list(df.columns)
+            else:
+                df = TextParser(chunk, header=None, names=columns).read()
+            df.index += start
+            yield df
+            start += len(chunk)
+            chunk = []
+    if columns is None:
+        yield TextParser([header] + chunk, header=0).read()
+    elif chunk:
+        df = TextParser(chunk, header=None, names=columns).read()
+        df.index += start
+        yield df